@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class ArtifactIndex:
+    """Sorted, non-overlapping artifact intervals [start, stop) in samples.
+
+    Intervals are looked up with binary search, and apply() replaces every artifact sample in a window by a
+    straight line between the samples just outside its interval, for all channels and intervals at once.
+    The recording itself is never edited, so marking can be undone.
+    """
+
+    def __init__(self):
+        self.starts = np.empty(0, dtype=np.int64)
+        self.stops = np.empty(0, dtype=np.int64)
+        self.history = []  # (starts, stops, added spans) before each add, for undo
+
+    def __len__(self):
+        return len(self.starts)
+
+    def spans(self):
+        return list(zip(self.starts.tolist(), self.stops.tolist()))
+
+    def set_spans(self, spans):
+        self.starts = np.empty(0, dtype=np.int64)
+        self.stops = np.empty(0, dtype=np.int64)
+        self.history = []
+        self._merge(spans)
+
+    def add(self, spans):
+        """Add intervals, merging any that touch or overlap.
+
+        Returns the merged intervals that contain the new spans: merging redraws the interpolation line over
+        all of them, so that is what views have to refresh.
+        """
+        spans = [(int(start), int(stop)) for start, stop in spans if stop > start]
+        if not spans:
+            return []
+        self.history.append((self.starts, self.stops, spans))
+        self._merge(spans)
+        return self._covering(spans)
+
+    def undo(self):
+        """Drop the last add; returns the merged intervals it had changed so views can refresh them."""
+        if not self.history:
+            return []
+        starts, stops, spans = self.history.pop()
+        changed = self._covering(spans)  # the earlier intervals merged into these lie inside them
+        self.starts, self.stops = starts, stops
+        return changed
+
+    def _covering(self, spans):
+        """The current intervals that intersect any of spans, in order."""
+        found = set()
+        for start, stop in spans:
+            first, last = self.overlapping(start, stop)
+            found.update(range(first, last))
+        return [(int(self.starts[idx]), int(self.stops[idx])) for idx in sorted(found)]
+
+    def _merge(self, spans):
+        if not len(spans):
+            return
+        new = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        starts = np.concatenate([self.starts, new[:, 0]])
+        stops = np.concatenate([self.stops, new[:, 1]])
+        order = np.argsort(starts, kind='stable')
+        starts, stops = starts[order], stops[order]
+        # A new group starts wherever an interval begins after every earlier one has ended
+        reach = np.maximum.accumulate(stops)
+        group_start = np.r_[True, starts[1:] > reach[:-1]]
+        self.starts = starts[group_start]
+        self.stops = np.maximum.reduceat(stops, np.flatnonzero(group_start))
+
+    def overlapping(self, start, stop):
+        """Index range of the intervals that intersect [start, stop)."""
+        first = np.searchsorted(self.stops, start, side='right')
+        last = np.searchsorted(self.starts, stop, side='left')
+        return first, max(first, last)
+
+    def apply(self, window, window_start, n_times, read_samples):
+        """Interpolate the artifact samples of a (channels x samples) window in place.
+
+        read_samples(sample_indices) must return the un-interpolated (channels x len(indices)) values at those
+        samples for the same channels as window.
+        """
+        first, last = self.overlapping(window_start, window_start + window.shape[1])
+        if first == last:
+            return window
+        starts, stops = self.starts[first:last], self.stops[first:last]
+
+        # The sample before and after each interval; at the recording edges the other side is held flat
+        left = np.where(starts > 0, starts - 1, stops)
+        right = np.where(stops < n_times, stops, starts - 1)
+        bounds = read_samples(np.clip(np.concatenate([left, right]), 0, n_times - 1))
+        left_values, right_values = bounds[:, :len(starts)], bounds[:, len(starts):]
+
+        # Every artifact sample inside the window, with its interval and position along the line
+        clipped_starts = np.maximum(starts, window_start)
+        clipped_stops = np.minimum(stops, window_start + window.shape[1])
+        lengths = clipped_stops - clipped_starts
+        interval = np.repeat(np.arange(len(starts)), lengths)
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        samples = clipped_starts[interval] + within
+        fraction = (samples - starts[interval]) / np.maximum(stops - starts - 1, 1)[interval]
+
+        window[:, samples - window_start] = (left_values[:, interval] +
+                                             (right_values - left_values)[:, interval] * fraction)
+        return window
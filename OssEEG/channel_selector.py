@@ -3,6 +3,11 @@ from PyQt6 import QtWidgets, QtCore
 class ChannelSelector:
     def __init__(self, eeg_analyzer):
         self.eeg_analyzer = eeg_analyzer
+        # Rapid clicks restart this timer, so a burst of selection changes produces a single redraw
+        self.selectionTimer = QtCore.QTimer()
+        self.selectionTimer.setSingleShot(True)
+        self.selectionTimer.setInterval(50)
+        self.selectionTimer.timeout.connect(self.applySelection)
 
     def initUI(self, layout):
         self.selectAllCheckbox = QtWidgets.QCheckBox("Select All")
@@ -15,33 +20,42 @@ class ChannelSelector:
         layout.addWidget(self.channelSelector)
 
     def populate_channel_selector(self):
+        self.selectionTimer.stop()
         self.channelSelector.blockSignals(True)
         self.channelSelector.clear()
         for ch_name in self.eeg_analyzer.channel_names:
             item = QtWidgets.QListWidgetItem(ch_name)
-            item.setSelected(True)
             self.channelSelector.addItem(item)
+            item.setSelected(True)  # only takes effect once the item is in the list
+        self.selectAllCheckbox.blockSignals(True)
         self.selectAllCheckbox.setChecked(True)
+        self.selectAllCheckbox.blockSignals(False)
         self.channelSelector.blockSignals(False)
+        self.eeg_analyzer.graph_manager.specparamAnalysisPlot.set_selected_channels(self.selected_channels())
+
+    def selected_channels(self):
+        """Names of the selected channels, in recording order."""
+        return [self.channelSelector.item(index).text() for index in range(self.channelSelector.count())
+                if self.channelSelector.item(index).isSelected()]
 
     def toggleSelectAll(self, state):
         self.channelSelector.blockSignals(True)
         for index in range(self.channelSelector.count()):
             item = self.channelSelector.item(index)
-            item.setSelected(state == QtCore.Qt.CheckState.Checked)
+            item.setSelected(QtCore.Qt.CheckState(state) == QtCore.Qt.CheckState.Checked)
         self.channelSelector.blockSignals(False)
-        self.eeg_analyzer.graph_manager.updateGraph()
+        self.selectionTimer.stop()
+        self.applySelection()
 
     def handleChannelSelectionChange(self):
-        selected_channels = [item.text() for item in self.channelSelector.selectedItems()]
-        self.eeg_analyzer.graph_manager.specparamAnalysisPlot.set_selected_channels(selected_channels)
-
-        if self.selectAllCheckbox.isChecked() and not all(item.isSelected() for item in self.channelSelector.findItems("*", QtCore.Qt.MatchFlag.MatchWildcard)):
+        all_selected = all(self.channelSelector.item(index).isSelected() for index in range(self.channelSelector.count()))
+        if self.selectAllCheckbox.isChecked() != all_selected:
             self.selectAllCheckbox.blockSignals(True)
-            self.selectAllCheckbox.setChecked(False)
+            self.selectAllCheckbox.setChecked(all_selected)
             self.selectAllCheckbox.blockSignals(False)
-        elif not self.selectAllCheckbox.isChecked() and all(item.isSelected() for item in self.channelSelector.findItems("*", QtCore.Qt.MatchFlag.MatchWildcard)):
-            self.selectAllCheckbox.blockSignals(True)
-            self.selectAllCheckbox.setChecked(True)
-            self.selectAllCheckbox.blockSignals(False)
-        self.eeg_analyzer.graph_manager.updateGraph()
+        self.selectionTimer.start()
+
+    def applySelection(self):
+        selected_channels = self.selected_channels()
+        self.eeg_analyzer.graph_manager.specparamAnalysisPlot.set_selected_channels(selected_channels)
+        self.eeg_analyzer.graph_manager.updateSelection(selected_channels)
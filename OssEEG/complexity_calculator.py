@@ -1,6 +1,10 @@
+import numpy as np
 from PyQt6 import QtWidgets, QtGui, QtCore
+import pyqtgraph as pg
 from OssEEG.report_selector import ReportSelectionDialog
+from complexity_epoch_worker import ComplexityEpochWorker
 from complexity_worker import ComplexityWorker
+from worker_slot import WorkerSlot
 import logging
 
 logging.basicConfig(level=logging.WARNING)
@@ -10,11 +14,27 @@ class ComplexityCalculator:
         self.eeg_analyzer = eeg_analyzer
         self.complexityButton = None
         self.exportButton = None
+        self.exportDataButton = None
+        self.results = None  # ComplexityResults of the last completed calculation
         self.complexityLayout = None
         self.complexityWidget = None
         self.loadingLabel = None
         self.loadingIcon = None
         self.movie = None
+        self.budgetWidget = None
+        self.budgetCheckBox = None
+        self.windowLengthInput = None
+        self.windowCountInput = None
+        self.timeCourseButton = None
+        self.epochLengthInput = None
+        self.epochStepInput = None
+        self.timeCourseWidget = None
+        self.timeCoursePlot = None
+        self.timeCourseMetric = None
+        self.epochs = None  # ComplexityEpochs of the last time courses
+        self.complexity_job = WorkerSlot(on_finished=self.on_job_finished)
+        self.epoch_job = WorkerSlot(on_finished=self.on_job_finished)
+        self.max_freq = 10.  # highest frequency the measures need; 256 Hz recordings are downsampled 10x
         logging.debug('Initialized ComplexityCalculator.')
 
     def initUI(self, layout):
@@ -38,6 +58,70 @@ class ComplexityCalculator:
 
         layout.addWidget(self.exportButton)
 
+        if self.exportDataButton is None:
+            self.exportDataButton = QtWidgets.QPushButton('Export Measures')
+            self.exportDataButton.clicked.connect(self.export_measures)
+            self.exportDataButton.setEnabled(self.results is not None)
+
+        if self.exportDataButton.parent() is not None:
+            self.exportDataButton.setParent(None)
+
+        layout.addWidget(self.exportDataButton)
+
+        # Sample and approximate entropy cost the square of the length; on request they are estimated from windows
+        if self.budgetWidget is None:
+            self.budgetCheckBox = QtWidgets.QCheckBox('Estimate SampEn/ApEn from windows')
+            self.budgetCheckBox.setChecked(False)
+            self.windowLengthInput = QtWidgets.QSpinBox()
+            self.windowLengthInput.setRange(100, 1000000)
+            self.windowLengthInput.setSingleStep(500)
+            self.windowLengthInput.setValue(5000)
+            self.windowLengthInput.setSuffix(' samples')
+            self.windowCountInput = QtWidgets.QSpinBox()
+            self.windowCountInput.setRange(2, 1000)
+            self.windowCountInput.setValue(8)
+            self.windowCountInput.setSuffix(' windows')
+            self.windowLengthInput.setEnabled(False)
+            self.windowCountInput.setEnabled(False)
+            self.budgetCheckBox.toggled.connect(self.windowLengthInput.setEnabled)
+            self.budgetCheckBox.toggled.connect(self.windowCountInput.setEnabled)
+
+            self.budgetWidget = QtWidgets.QWidget()
+            budget_layout = QtWidgets.QHBoxLayout(self.budgetWidget)
+            budget_layout.setContentsMargins(0, 0, 0, 0)
+            budget_layout.addWidget(self.budgetCheckBox)
+            budget_layout.addWidget(self.windowLengthInput)
+            budget_layout.addWidget(self.windowCountInput)
+
+        if self.budgetWidget.parent() is not None:
+            self.budgetWidget.setParent(None)
+
+        layout.addWidget(self.budgetWidget)
+
+        # Time courses of every measure over sliding windows
+        if self.timeCourseButton is None:
+            self.timeCourseButton = QtWidgets.QPushButton('Complexity Time Courses')
+            self.timeCourseButton.clicked.connect(self.calculate_time_courses)
+            self.timeCourseButton.setEnabled(self.complexityButton.isEnabled())
+            self.epochLengthInput = QtWidgets.QDoubleSpinBox()
+            self.epochLengthInput.setRange(1., 3600.)
+            self.epochLengthInput.setValue(10.)
+            self.epochLengthInput.setSuffix(' s windows')
+            self.epochStepInput = QtWidgets.QDoubleSpinBox()
+            self.epochStepInput.setRange(.1, 3600.)
+            self.epochStepInput.setValue(5.)
+            self.epochStepInput.setSuffix(' s step')
+
+        for widget in (self.timeCourseButton, self.epochLengthInput, self.epochStepInput):
+            if widget.parent() is not None:
+                widget.setParent(None)
+
+        epoch_layout = QtWidgets.QHBoxLayout()
+        epoch_layout.addWidget(self.timeCourseButton)
+        epoch_layout.addWidget(self.epochLengthInput)
+        epoch_layout.addWidget(self.epochStepInput)
+        layout.addLayout(epoch_layout)
+
         if self.complexityLayout is None:
             self.complexityLayout = QtWidgets.QVBoxLayout()
 
@@ -72,8 +156,11 @@ class ComplexityCalculator:
         if self.complexityButton is not None:
             self.complexityButton.setEnabled(True)
             logging.debug('Complexity button enabled.')
+        if self.timeCourseButton is not None:
+            self.timeCourseButton.setEnabled(True)
 
     def calculate_complexity(self):
+        self.cancel()  # a new request supersedes the running one
         self.clearLayout(self.complexityLayout)
         logging.debug('Started complexity calculation.')
 
@@ -84,33 +171,137 @@ class ComplexityCalculator:
         # Show the loading message and animation
         self.show_loading_indicator()
 
-        selected_channels = [item.text() for item in self.eeg_analyzer.channel_selector.channelSelector.selectedItems()]
-        selected_indices = [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
-        selected_data = self.eeg_analyzer.data[selected_indices]
-        selected_channel_names = [self.eeg_analyzer.channel_names[idx] for idx in selected_indices]
+        samples, spectrum, selected_channel_names = self.selected_samples()
+        logging.debug(f'Selected channels: {selected_channel_names}')
+        worker = ComplexityWorker(samples, selected_channel_names, spectrum=spectrum, budget=self.budget())
+        self.complexity_job.start(worker, [(worker.complexityFinished, self.display_complexity),
+                                           (worker.resultsChanged, self.display_partial)])
 
-        logging.debug(f'Selected channels: {selected_channels}')
+    def selected_samples(self):
+        """(samples, spectrum, channel names) of the selected channels.
 
-        self.complexityWorker = ComplexityWorker(selected_data, self.eeg_analyzer.sf, selected_channel_names,
-                                                 downsample_factor=10)
-        self.complexityWorker.complexityFinished.connect(self.display_complexity)
-        self.complexityWorker.finished.connect(self.on_worker_finished)
-        self.complexityWorker.start()
+        samples() reads their downsampled data and spectrum() their Welch PSDs, for spectral entropy. Both are
+        shared with the other analyses through the resampler and the SpectralEngine and run on the worker thread;
+        everything they read is fixed here, so later changes cannot leak into the result.
+        """
+        selected_channels = self.eeg_analyzer.channel_selector.selected_channels()
+        selected_indices = tuple(self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels)
+        version, sf, max_freq = self.eeg_analyzer.data_version, self.eeg_analyzer.sf, self.max_freq
+        get_data = self.eeg_analyzer.get_data
+        samples = lambda: self.eeg_analyzer.resampler.decimate(version, selected_indices, get_data, sf, max_freq)
+        spectrum = lambda: self.eeg_analyzer.spectral_engine.welch(version, selected_indices, get_data, sf,
+                                                                   nperseg=256, max_freq=max_freq)
+        return samples, spectrum, [self.eeg_analyzer.channel_names[idx] for idx in selected_indices]
 
-    def display_complexity(self, text):
-        self.complexityWidget.setText(text)
+    def calculate_time_courses(self):
+        """Compute every measure over sliding windows and plot them against time."""
+        self.show_loading_indicator()
+        samples, _, channel_names = self.selected_samples()
+        worker = ComplexityEpochWorker(samples, channel_names, self.epochLengthInput.value(),
+                                       self.epochStepInput.value())
+        # new time courses supersede the running ones
+        self.epoch_job.start(worker, [(worker.epochsFinished, self.display_time_courses),
+                                      (worker.progressChanged, self.update_time_course_progress)])
+
+    def update_time_course_progress(self, done, total):
+        self.loadingLabel.setText(f"Calculating complexity time courses... {done}/{total}")
+
+    def display_time_courses(self, epochs):
+        self.epochs = epochs
+        if self.timeCourseWidget is None or self.timeCourseWidget.parent() is None:
+            self.timeCourseWidget = QtWidgets.QWidget()
+            time_course_layout = QtWidgets.QVBoxLayout(self.timeCourseWidget)
+            self.timeCourseMetric = QtWidgets.QComboBox()
+            self.timeCourseMetric.currentIndexChanged.connect(self.plot_time_courses)
+            self.timeCoursePlot = pg.PlotWidget(title="Complexity Time Courses")
+            self.timeCoursePlot.setBackground('w')
+            self.timeCoursePlot.setLabel('bottom', 'Time', units='s')
+            time_course_layout.addWidget(self.timeCourseMetric)
+            time_course_layout.addWidget(self.timeCoursePlot)
+            self.complexityLayout.addWidget(self.timeCourseWidget)
+        self.timeCourseMetric.blockSignals(True)
+        self.timeCourseMetric.clear()
+        self.timeCourseMetric.addItems(epochs.labels)
+        self.timeCourseMetric.blockSignals(False)
+        self.plot_time_courses()
+        logging.debug('Displayed complexity time courses.')
+
+    def plot_time_courses(self):
+        """One curve per channel of the chosen measure, with the channel average in black."""
+        self.timeCoursePlot.clear()
+        if self.epochs is None:
+            return
+        metric = self.epochs.metrics[max(self.timeCourseMetric.currentIndex(), 0)]
+        courses = self.epochs.metric(metric)
+        if len(courses) <= 16:
+            self.timeCoursePlot.addLegend()
+        for idx, (channel, course) in enumerate(zip(self.epochs.channel_names, courses)):
+            self.timeCoursePlot.plot(self.epochs.times, course, pen=pg.intColor(idx, hues=len(courses)),
+                                     name=channel)
+        self.timeCoursePlot.plot(self.epochs.times, np.nanmean(courses, axis=0), pen=pg.mkPen('k', width=2),
+                                 name='Average')
+        self.timeCoursePlot.setLabel('left', self.epochs.labels[self.epochs.metrics.index(metric)])
+
+    def budget(self):
+        """(window length, number of windows) for sample and approximate entropy, or None to compute them exactly."""
+        if self.budgetCheckBox is None or not self.budgetCheckBox.isChecked():
+            return None
+        return self.windowLengthInput.value(), self.windowCountInput.value()
+
+    def display_partial(self, results):
+        """Show the measures as they come in from the worker."""
+        self.complexityWidget.setText(results.to_text())
+        self.loadingLabel.setText(f"Calculating complexity measures... {results.done.sum()}/{results.done.size}")
+
+    def display_complexity(self, results):
+        self.results = results
+        self.complexityWidget.setText(results.to_text())
         self.exportButton.setEnabled(True)
+        self.exportDataButton.setEnabled(True)
         logging.debug('Displayed complexity results.')
 
-    def on_worker_finished(self):
-        logging.debug('ComplexityWorker finished.')
-        self.hide_loading_indicator()
+    def cancel(self):
+        """Stop calculations that are no longer wanted; they stop between channels and their results are ignored."""
+        self.cancel_time_courses()
+        if self.complexity_job.cancel():
+            logging.debug('Cancelled ComplexityWorker.')
+            self.on_job_finished()
+
+    def cancel_time_courses(self):
+        if self.epoch_job.cancel():
+            logging.debug('Cancelled ComplexityEpochWorker.')
+            self.on_job_finished()
+
+    def on_job_finished(self):
+        if self.complexity_job.worker is None and self.epoch_job.worker is None:
+            self.hide_loading_indicator()
+
+    def export_measures(self):
+        """Save the channels x measures table as CSV, Parquet or JSON."""
+        if self.results is None:
+            return
+        options = QtWidgets.QFileDialog.Option.DontUseNativeDialog
+        file_name, selected_filter = QtWidgets.QFileDialog.getSaveFileName(
+            None, "Export Complexity Measures", "", "CSV Files (*.csv);;Parquet Files (*.parquet);;JSON Files (*.json)",
+            options=options)
+        if not file_name:
+            return
+        extension = selected_filter[selected_filter.index('*') + 1:-1]
+        if '.' not in file_name.rsplit('/', 1)[-1]:
+            file_name += extension
+        try:
+            self.results.export(file_name)
+        except (ImportError, ValueError, OSError) as e:  # Parquet needs pyarrow or fastparquet
+            QtWidgets.QMessageBox.warning(None, "Export Complexity Measures", str(e))
+            return
+        logging.debug(f'Complexity measures exported to {file_name}')
 
     def show_export_dialog(self):
         dialog = ReportSelectionDialog(self.eeg_analyzer)
         dialog.exec()
 
     def show_loading_indicator(self):
+        self.loadingLabel.setText("Calculating complexity measures... (This may take a while)")
         self.loadingLabel.setVisible(True)
         self.loadingIcon.setVisible(True)
         self.movie.start()
@@ -0,0 +1,104 @@
+import numpy as np
+
+# (key, label) of every measure, in the order of the report
+METRICS = (('apen', 'Approximate Entropy'), ('pe', 'Permutation Entropy'), ('se', 'Spectral Entropy'),
+           ('svd_entropy', 'SVD Entropy'), ('sampen', 'Sample Entropy'), ('hfd', 'Higuchi Fractal Dimension'),
+           ('dfa', 'Detrended Fluctuation Analysis'))
+METRIC_KEYS = tuple(key for key, _ in METRICS)
+# The quadratic-ish entropies go first, so the pool is not left waiting on them at the end
+SCHEDULE_ORDER = ('sampen', 'apen', 'dfa', 'hfd', 'svd_entropy', 'pe', 'se')
+# Measures whose cost grows with the square of the signal length, which the budget mode estimates from windows
+BUDGETED_METRICS = ('sampen', 'apen')
+
+
+def channel_metric(metric, channel_data, sf):
+    """One complexity measure of one channel, with the settings of the complexity report.
+
+    Runs in the process pool, so it imports antropy itself.
+    """
+    import antropy as ant
+
+    if metric == 'apen':
+        return ant.app_entropy(channel_data, order=2)
+    if metric == 'pe':
+        return ant.perm_entropy(channel_data, order=3, delay=1, normalize=False)
+    if metric == 'se':
+        return ant.spectral_entropy(channel_data, sf, method='welch', normalize=True)
+    if metric == 'svd_entropy':
+        return ant.svd_entropy(channel_data, order=3)
+    if metric == 'sampen':
+        return ant.sample_entropy(channel_data, order=2)
+    if metric == 'hfd':
+        return ant.higuchi_fd(channel_data, kmax=10)
+    if metric == 'dfa':
+        return ant.detrended_fluctuation(channel_data)
+    raise ValueError(f"unknown complexity measure {metric}")
+
+
+def measure(metric, channel_data, sf, budget=None, seed=0):
+    """(value, 95% CI low, high) of one measure of one channel; the interval is NaN for exact values.
+
+    With budget=(window_length, n_windows), sample and approximate entropy of channels that hold at least two
+    windows are estimated with windowed_entropy. Shorter channels, and channels where fewer than two windows
+    give a finite estimate, are computed exactly.
+    """
+    if budget is not None and metric in BUDGETED_METRICS and len(channel_data) >= 2 * budget[0]:
+        estimate = windowed_entropy(metric, channel_data, *budget, seed=seed)
+        if np.isfinite(estimate[1]):
+            return estimate
+    return channel_metric(metric, channel_data, sf), np.nan, np.nan
+
+
+def windowed_entropy(metric, channel_data, window_length, n_windows, seed=0):
+    """Sample or approximate entropy estimated from n_windows randomly chosen, non-overlapping windows.
+
+    The cost is bounded by the budget instead of growing with the square of the recording length. The
+    tolerance is taken from the whole channel, as for the exact value. Returns (mean, low, high), with a
+    normal 95% confidence interval of the mean entropy of window_length-sample segments; that is not an
+    interval for the entropy of the whole channel, which approximate entropy in particular depends on the
+    length of. Runs in the process pool.
+    """
+    import antropy as ant
+
+    entropy = ant.sample_entropy if metric == 'sampen' else ant.app_entropy
+    tolerance = float(0.2 * np.std(channel_data))
+    # Disjoint segments, so that the windows are not near-copies of each other
+    n_segments = len(channel_data) // window_length
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.choice(n_segments, size=min(n_windows, n_segments), replace=False)) * window_length
+    estimates = np.array([entropy(channel_data[start:start + window_length], order=2, tolerance=tolerance)
+                          for start in starts])
+    estimates = estimates[np.isfinite(estimates)]  # windows without any match have no sample entropy
+    if not len(estimates):
+        return np.nan, np.nan, np.nan
+    mean = estimates.mean()
+    half_width = 1.96 * estimates.std(ddof=1) / np.sqrt(len(estimates)) if len(estimates) > 1 else np.nan
+    return mean, mean - half_width, mean + half_width
+
+
+def epochs(data, window_length, step):
+    """(channels x) windows x window_length sliding windows over data, as a strided view that copies no samples."""
+    return np.lib.stride_tricks.sliding_window_view(data, window_length, axis=-1)[..., ::step, :]
+
+
+def epoch_metric(metric, channel_data, window_length, step, sf):
+    """One complexity measure of every sliding window of one channel. Runs in the process pool.
+
+    Takes the channel itself rather than its windows, so that only the samples are sent to the pool.
+    """
+    windows = epochs(channel_data, window_length, step)
+    if metric == 'se':
+        from scipy.signal import welch
+
+        # antropy's Welch settings, for all windows at once
+        return spectral_entropy(welch(windows, sf, nperseg=min(256, windows.shape[-1]), axis=-1)[1])
+    return np.array([channel_metric(metric, window, sf) for window in windows])
+
+
+def spectral_entropy(psd):
+    """Normalised spectral entropy of every row of psd, as antropy defines it for Welch PSDs."""
+    psd_norm = psd / psd.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(psd_norm > 0, psd_norm * np.log2(psd_norm), 0.)
+    return -terms.sum(axis=-1) / np.log2(psd.shape[-1])
+
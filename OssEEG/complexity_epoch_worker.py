@@ -0,0 +1,49 @@
+import numpy as np
+from PyQt6.QtCore import QThread, pyqtSignal
+import logging
+
+from complexity_engine import METRIC_KEYS, SCHEDULE_ORDER, epoch_metric
+from complexity_epochs import ComplexityEpochs
+from process_pool import run_tasks
+
+logging.basicConfig(level=logging.WARNING)
+
+class ComplexityEpochWorker(QThread):
+    """Every complexity measure over sliding windows of the downsampled data."""
+    epochsFinished = pyqtSignal(object)  # ComplexityEpochs
+    progressChanged = pyqtSignal(int, int)  # (channel, measure) pairs done, total pairs
+
+    def __init__(self, samples, channel_names, window_seconds, step_seconds):
+        super().__init__()
+        self.samples = samples  # () -> (channels x samples data, sf), already downsampled for the measures
+        self.channel_names = tuple(channel_names)
+        self.window_seconds = window_seconds
+        self.step_seconds = step_seconds
+
+    def run(self):
+        data, sf = self.samples()
+        window_length = min(max(int(round(self.window_seconds * sf)), 2), data.shape[-1])
+        step = max(int(round(self.step_seconds * sf)), 1)
+        n_windows = (data.shape[-1] - window_length) // step + 1
+        times = (np.arange(n_windows) * step + window_length / 2) / sf
+        values = np.full((len(data), n_windows, len(METRIC_KEYS)), np.nan)
+        logging.debug(f'ComplexityEpochWorker: {n_windows} windows of {window_length} samples.')
+
+        # One task per (channel, measure) over all of its windows
+        pairs = [(channel, METRIC_KEYS.index(metric)) for metric in SCHEDULE_ORDER for channel in range(len(data))]
+        tasks = [(epoch_metric, (METRIC_KEYS[metric], data[channel], window_length, step, sf))
+                 for channel, metric in pairs]
+        done = 0
+
+        def on_result(idx, result):
+            nonlocal done
+            channel, metric = pairs[idx]
+            values[channel, :, metric] = result
+            done += 1
+            self.progressChanged.emit(done, len(tasks))
+
+        if not run_tasks(tasks, self.isInterruptionRequested, on_result):
+            logging.debug('ComplexityEpochWorker cancelled.')
+            return
+
+        self.epochsFinished.emit(ComplexityEpochs(self.channel_names, times, values))
@@ -0,0 +1,32 @@
+import numpy as np
+
+from complexity_engine import METRICS
+
+
+class ComplexityEpochs:
+    """Complexity measures over sliding windows, as one channels x windows x measures array.
+
+    times holds the centre of every window in seconds.
+    """
+
+    def __init__(self, channel_names, times, values, metrics=METRICS):
+        self.channel_names = tuple(channel_names)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.metrics = tuple(key for key, _ in metrics)
+        self.labels = tuple(label for _, label in metrics)
+        self.values = np.asarray(values, dtype=np.float64)
+
+    def metric(self, metric):
+        """channels x windows time courses of one measure key (e.g. 'sampen')."""
+        return self.values[:, :, self.metrics.index(metric)]
+
+    def channel(self, channel):
+        """windows x measures of one channel."""
+        return self.values[self.channel_names.index(channel)]
+
+    def to_dataframe(self):
+        """Long table with a (channel, time) row per window and a column per measure."""
+        import pandas as pd
+
+        index = pd.MultiIndex.from_product([self.channel_names, self.times], names=['channel', 'time'])
+        return pd.DataFrame(self.values.reshape(-1, len(self.metrics)), index=index, columns=self.metrics)
@@ -0,0 +1,134 @@
+import csv
+import html
+import json
+
+import numpy as np
+
+from complexity_engine import METRICS
+
+
+class ComplexityResults:
+    """Complexity measures as one channels x measures array with named axes.
+
+    done marks the measures that have been computed; the rest are still pending and read as NaN.
+    Measures estimated from windows of window_length samples carry ci_low and ci_high, the 95% confidence
+    interval of the mean over those windows (NaN for exact values). Exports to CSV, Parquet and JSON, and
+    renders the text of the complexity report.
+    """
+
+    def __init__(self, channel_names, values, done=None, ci_low=None, ci_high=None, window_length=None,
+                 metrics=METRICS):
+        self.channel_names = tuple(channel_names)
+        self.metrics = tuple(key for key, _ in metrics)
+        self.labels = tuple(label for _, label in metrics)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.done = np.ones(self.values.shape, dtype=bool) if done is None else np.asarray(done, dtype=bool)
+        self.ci_low = np.full(self.values.shape, np.nan) if ci_low is None else np.asarray(ci_low, dtype=np.float64)
+        self.ci_high = np.full(self.values.shape, np.nan) if ci_high is None else np.asarray(ci_high, dtype=np.float64)
+        self.window_length = window_length
+
+    @property
+    def complete(self):
+        return bool(self.done.all())
+
+    def value(self, channel, metric):
+        """A single measure, by channel name and measure key (e.g. 'sampen')."""
+        return self.values[self.channel_names.index(channel), self.metrics.index(metric)]
+
+    def channel(self, channel):
+        """{measure key: value} of one channel."""
+        row = self.values[self.channel_names.index(channel)]
+        return dict(zip(self.metrics, row))
+
+    def metric(self, metric):
+        """The values of one measure over all channels, in channel order."""
+        return self.values[:, self.metrics.index(metric)]
+
+    def estimated(self):
+        """Keys of the measures that were estimated from windows for at least one channel."""
+        return tuple(metric for metric, low in zip(self.metrics, self.ci_low.T) if np.isfinite(low).any())
+
+    def averages(self):
+        """Mean of every measure over the channels where it is done and defined."""
+        finished = np.where(self.done, self.values, np.nan)
+        counts = (~np.isnan(finished)).sum(axis=0)
+        return np.where(counts > 0, np.nansum(finished, axis=0) / np.maximum(counts, 1), np.nan)
+
+    def to_text(self):
+        """The complexity report; measures that are not done yet show as pending."""
+        fmt = lambda value, ready: f"{value:.6f}" if ready else "pending"
+        ci = lambda low, high: (f" (estimate from {self.window_length}-sample windows, 95% CI of the window mean "
+                                f"{low:.6f} to {high:.6f})" if np.isfinite(low) else "")
+        estimated = self.estimated()
+
+        text = "Complexity Measures:\n\n"
+        text += "Averages:\n"
+        text += "--------------------------------\n"
+        for metric, label, average, ready in zip(self.metrics, self.labels, self.averages(), self.done.any(axis=0)):
+            marker = " (includes window estimates)" if metric in estimated else ""
+            text += f"- Average {label}: {fmt(average, ready)}{marker}\n"
+        text += "\n"
+
+        for channel, row, row_done, lows, highs in zip(self.channel_names, self.values, self.done, self.ci_low,
+                                                       self.ci_high):
+            text += f"Channel: {channel}\n"
+            text += "--------------------------------\n"
+            for label, value, ready, low, high in zip(self.labels, row, row_done, lows, highs):
+                text += f"- {label}: {fmt(value, ready)}{ci(low, high) if ready else ''}\n"
+            text += "\n"
+        return text
+
+    def to_html(self):
+        """Channels x measures table for the HTML report."""
+        header = "".join(f"<th>{label}</th>" for label in self.labels)
+        ci = lambda low, high: (f"<br><small>estimate from {self.window_length}-sample windows, 95% CI of the "
+                                f"window mean {low:.6f} to {high:.6f}</small>" if np.isfinite(low) else "")
+        cells = lambda row, lows, highs: "".join(f"<td>{value:.6f}{ci(low, high)}</td>"
+                                                 for value, low, high in zip(row, lows, highs))
+        rows = "".join(f"<tr><td>{html.escape(channel)}</td>{cells(row, lows, highs)}</tr>"
+                       for channel, row, lows, highs in zip(self.channel_names, self.values, self.ci_low, self.ci_high))
+        averages = "".join(f"<td>{value:.6f}</td>" for value in self.averages())
+        return (f"<table border='1'><tr><th>Channel</th>{header}</tr>{rows}"
+                f"<tr><td><b>Average</b></td>{averages}</tr></table>")
+
+    def columns(self):
+        """(names, channels x columns array) of the measures followed by the bounds of the estimated ones."""
+        estimated = [self.metrics.index(metric) for metric in self.estimated()]
+        names = self.metrics + tuple(f"{self.metrics[idx]}_window_ci_{bound}" for idx in estimated
+                                     for bound in ('low', 'high'))
+        bounds = [array[:, idx] for idx in estimated for array in (self.ci_low, self.ci_high)]
+        return names, np.column_stack([self.values] + bounds)
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        names, table = self.columns()
+        return pd.DataFrame(table, index=pd.Index(self.channel_names, name='channel'), columns=names)
+
+    def to_csv(self, path):
+        names, table = self.columns()
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(('channel',) + names)
+            for channel, row in zip(self.channel_names, table):
+                writer.writerow([channel] + [repr(float(value)) for value in row])
+
+    def to_parquet(self, path):
+        """Needs pyarrow or fastparquet, like pandas' own Parquet support."""
+        self.to_dataframe().to_parquet(path)
+
+    def to_json(self, path):
+        as_lists = lambda array: [[None if np.isnan(value) else float(value) for value in row] for row in array]
+        with open(path, 'w') as file:
+            json.dump({'channels': list(self.channel_names), 'metrics': list(self.metrics),
+                       'labels': list(self.labels), 'values': as_lists(self.values),
+                       'window_length': self.window_length, 'ci_low': as_lists(self.ci_low),
+                       'ci_high': as_lists(self.ci_high)}, file)
+
+    def export(self, path):
+        """Write the results in the format given by the file extension (.csv, .parquet or .json)."""
+        extension = path.rsplit('.', 1)[-1].lower()
+        exporters = {'csv': self.to_csv, 'parquet': self.to_parquet, 'json': self.to_json}
+        if extension not in exporters:
+            raise ValueError(f"Unknown export format '.{extension}', use .csv, .parquet or .json")
+        exporters[extension](path)
@@ -1,80 +1,58 @@
+import numpy as np
 from PyQt6.QtCore import QThread, pyqtSignal
-from custom_complexity_calculator import CustomComplexityCalculator
 import logging
 
+from complexity_engine import METRIC_KEYS, SCHEDULE_ORDER, measure, spectral_entropy
+from complexity_results import ComplexityResults
+from process_pool import run_tasks
+
 logging.basicConfig(level=logging.WARNING)
 
 class ComplexityWorker(QThread):
-    complexityFinished = pyqtSignal(str)
+    complexityFinished = pyqtSignal(object)  # ComplexityResults
+    resultsChanged = pyqtSignal(object)  # ComplexityResults so far, with the pending measures marked
 
-    def __init__(self, data, sf, channel_names, downsample_factor=10):
+    def __init__(self, samples, channel_names, spectrum=None, budget=None):
         super().__init__()
-        self.data = data
-        self.sf = sf
-        self.channel_names = channel_names
-        self.downsample_factor = downsample_factor
+        self.samples = samples  # () -> (channels x samples data, sf), already downsampled for the measures
+        self.channel_names = tuple(channel_names)
+        self.spectrum = spectrum  # () -> (freqs, channels x freqs) Welch PSDs of the downsampled data
+        self.budget = budget  # (window_length, n_windows) to estimate SampEn and ApEn from windows, or None
+        self.values = None  # channels x measures, in the order of complexity_engine.METRICS
         logging.debug(f'Initialized ComplexityWorker with {len(channel_names)} channels.')
 
     def run(self):
-        calculator = CustomComplexityCalculator(self.data, self.sf, self.channel_names, self.downsample_factor)
-        text = "Complexity Measures:\n\n"
+        data, sf = self.samples()
+        self.values = np.full((len(data), len(METRIC_KEYS)), np.nan)
+        ci_low, ci_high = self.values.copy(), self.values.copy()  # confidence intervals of estimated measures
+        done = np.zeros(self.values.shape, dtype=bool)
+        window_length = None if self.budget is None else self.budget[0]
+        snapshot = lambda: ComplexityResults(self.channel_names, self.values.copy(), done.copy(), ci_low.copy(),
+                                             ci_high.copy(), window_length)
 
         logging.debug('Starting complexity calculations.')
-
-        apen_df = calculator.approximate_entropy()
-        logging.debug('Finished approximate entropy calculations.')
-
-        pe_df = calculator.permutation_entropy()
-        logging.debug('Finished permutation entropy calculations.')
-
-        se_df = calculator.spectral_entropy()
-        logging.debug('Finished spectral entropy calculations.')
-
-        svd_entropy_df = calculator.svd_entropy()
-        logging.debug('Finished SVD entropy calculations.')
-
-        sampen_df = calculator.sample_entropy()
-        logging.debug('Finished sample entropy calculations.')
-
-        hfd_df = calculator.higuchi_fd()
-        logging.debug('Finished Higuchi fractal dimension calculations.')
-
-        dfa_df = calculator.detrended_fluctuation_analysis()
-        logging.debug('Finished detrended fluctuation analysis calculations.')
-
-        # Calculate averages for each measure
-        avg_apen = apen_df.mean().values[0]
-        avg_pe = pe_df.mean().values[0]
-        avg_se = se_df.mean().values[0]
-        avg_svd_entropy = svd_entropy_df.mean().values[0]
-        avg_sampen = sampen_df.mean().values[0]
-        avg_hfd = hfd_df.mean().values[0]
-        avg_dfa = dfa_df.mean().values[0]
-
-        # Append averages to the text
-        text += "Averages:\n"
-        text += "--------------------------------\n"
-        text += f"- Average Approximate Entropy: {avg_apen:.6f}\n"
-        text += f"- Average Permutation Entropy: {avg_pe:.6f}\n"
-        text += f"- Average Spectral Entropy: {avg_se:.6f}\n"
-        text += f"- Average SVD Entropy: {avg_svd_entropy:.6f}\n"
-        text += f"- Average Sample Entropy: {avg_sampen:.6f}\n"
-        text += f"- Average Higuchi Fractal Dimension: {avg_hfd:.6f}\n"
-        text += f"- Average Detrended Fluctuation Analysis: {avg_dfa:.6f}\n"
-        text += "\n"
-
-        for channel in self.channel_names:
-            text += f"Channel: {channel}\n"
-            text += "--------------------------------\n"
-            text += f"- Approximate Entropy: {apen_df[channel + '_apen'].values[0]:.6f}\n"
-            text += f"- Permutation Entropy: {pe_df[channel + '_pe'].values[0]:.6f}\n"
-            text += f"- Spectral Entropy: {se_df[channel + '_se'].values[0]:.6f}\n"
-            text += f"- SVD Entropy: {svd_entropy_df[channel + '_svd_entropy'].values[0]:.6f}\n"
-            text += f"- Sample Entropy: {sampen_df[channel + '_sampen'].values[0]:.6f}\n"
-            text += f"- Higuchi Fractal Dimension: {hfd_df[channel + '_hfd'].values[0]:.6f}\n"
-            text += f"- Detrended Fluctuation Analysis: {dfa_df[channel + '_dfa'].values[0]:.6f}\n"
-            text += "\n"
+        metrics = list(SCHEDULE_ORDER)
+        if self.spectrum is not None:
+            # Spectral entropy comes from the shared PSDs, all channels at once
+            se = METRIC_KEYS.index('se')
+            self.values[:, se] = spectral_entropy(self.spectrum()[1])
+            done[:, se] = True
+            metrics.remove('se')
+            self.resultsChanged.emit(snapshot())
+
+        # One task per (channel, measure), so that the wall-clock time scales with the number of cores
+        pairs = [(channel, METRIC_KEYS.index(metric)) for metric in metrics for channel in range(len(data))]
+        tasks = [(measure, (METRIC_KEYS[metric], data[channel], sf, self.budget, channel)) for channel, metric in pairs]
+
+        def on_result(idx, result):
+            self.values[pairs[idx]], ci_low[pairs[idx]], ci_high[pairs[idx]] = result
+            done[pairs[idx]] = True
+            self.resultsChanged.emit(snapshot())
+
+        if not run_tasks(tasks, self.isInterruptionRequested, on_result):
+            logging.debug('ComplexityWorker cancelled.')
+            return
 
         logging.debug('Finished all complexity calculations.')
-
-        self.complexityFinished.emit(text)
+        self.complexityFinished.emit(ComplexityResults(self.channel_names, self.values, None, ci_low, ci_high,
+                                                         window_length))
@@ -1,4 +1,5 @@
 import logging
+import threading
 
 import joblib
 from PyQt6.QtWidgets import QMainWindow, QSplitter, QVBoxLayout, QWidget, QMessageBox, QDialog
@@ -9,6 +10,9 @@ logging.basicConfig(level=logging.WARNING)
 
 from PyQt6 import QtWidgets, QtGui, QtCore
 import numpy as np
+from artifact_index import ArtifactIndex
+from resampler import Resampler
+from spectral_engine import SpectralEngine
 from channel_selector import ChannelSelector
 from complexity_calculator import ComplexityCalculator
 from eeg_file_handler import EEGFileHandler
@@ -27,6 +31,10 @@ class EEGAnalyzer(QMainWindow):
         super().__init__()
         self.predictButton = None
         self.sf = 128.  # default sampling frequency
+        self.dtype = np.float64  # working precision of the shared sample buffer
+        self.data_version = 0  # bumped by loads, filters, ICA and artifact edits; keys every derived-product cache
+        self.read_lock = threading.Lock()  # MNE readers are not thread-safe; serialises lazy reads from the workers
+        self.read_chunk_duration = 10.  # seconds read per lock hold, so page reads interleave with long worker reads
         self.band_d = {'Infra': [-np.inf, 0.1],
                        'Delta': [0.1, 4.],
                        'Theta': [4., 8.],
@@ -42,6 +50,9 @@ class EEGAnalyzer(QMainWindow):
         self.complexity_calculator = ComplexityCalculator(self)
         self.raw = None
         self.data = None
+        self.artifacts = ArtifactIndex()  # interpolated at read time, mirrored as BAD_artifact annotations
+        self.resampler = Resampler()  # downsampled channels shared by the analyses that need a lower rate
+        self.spectral_engine = SpectralEngine(self.resampler)  # PSDs shared by the spectral views, complexity and reports
         self.channel_names = []  # Initialize channel_names
         self.model_manager = ModelManager(self)  # Initialize ModelManager
         self.initUI()
@@ -78,6 +89,22 @@ class EEGAnalyzer(QMainWindow):
         load_file_action.triggered.connect(self.file_loader.loadFile)
         file_menu.addAction(load_file_action)
 
+        lazy_loading_action = QtGui.QAction('Lazy Loading (Large Files)', self)
+        lazy_loading_action.setCheckable(True)
+        lazy_loading_action.toggled.connect(self.set_lazy_loading)
+        file_menu.addAction(lazy_loading_action)
+
+        cache_action = QtGui.QAction('Cache Recordings for Fast Re-open', self)
+        cache_action.setCheckable(True)
+        cache_action.setChecked(self.file_handler.use_cache)
+        cache_action.toggled.connect(self.set_use_cache)
+        file_menu.addAction(cache_action)
+
+        precision_action = QtGui.QAction('Use Float32 Precision', self)
+        precision_action.setCheckable(True)
+        precision_action.toggled.connect(self.set_float32_precision)
+        file_menu.addAction(precision_action)
+
         # Export menu
         report_menu = menu_bar.addMenu('Export')
 
@@ -185,14 +212,18 @@ class EEGAnalyzer(QMainWindow):
 
     def apply_low_pass_filter(self):
         if self.raw is not None:
+            self.to_full_precision()
             self.raw.filter(None, 40., fir_design='firwin')
-            self.data = self.raw.get_data()
+            self.apply_precision()
+            self.mark_data_changed()
             self.graph_manager.updateGraph()
 
     def apply_high_pass_filter(self):
         if self.raw is not None:
+            self.to_full_precision()
             self.raw.filter(1., None, fir_design='firwin')
-            self.data = self.raw.get_data()
+            self.apply_precision()
+            self.mark_data_changed()
             self.graph_manager.updateGraph()
 
     def apply_custom_filter(self):
@@ -202,14 +233,156 @@ class EEGAnalyzer(QMainWindow):
             high_cutoff, ok2 = QtWidgets.QInputDialog.getDouble(self, "Custom Filter", "Enter High Cutoff Frequency:",
                                                                 40.0, 0, 1000, 2)
             if ok1 and ok2:
+                self.to_full_precision()
                 self.raw.filter(low_cutoff, high_cutoff, fir_design='firwin')
-                self.data = self.raw.get_data()
+                self.apply_precision()
+                self.mark_data_changed()
                 self.graph_manager.updateGraph()
 
-    def calculate_kurtosis(self):
+    def set_lazy_loading(self, enabled):
+        self.file_handler.lazy = enabled
+
+    def set_use_cache(self, enabled):
+        self.file_handler.use_cache = enabled
+
+    def set_float32_precision(self, enabled):
+        self.dtype = np.float32 if enabled else np.float64
+        if self.raw is not None:
+            self.apply_precision()
+            self.mark_data_changed()
+            self.graph_manager.updateGraph()
+
+    def ensure_loaded(self):
+        """Bring a lazily opened recording into memory (filters and ICA need the full signal)."""
+        if self.raw is not None and not self.raw.preload:
+            with self.read_lock:
+                self.raw.load_data()
+            self.apply_precision()
+
+    def apply_precision(self):
+        """Store the loaded samples in the working precision and re-point data at them."""
+        if self.raw is not None and self.raw.preload and self.raw._data.dtype != self.dtype:
+            self.raw._data = self.raw._data.astype(self.dtype)
+        self.refresh_data()
+
+    def to_full_precision(self):
+        """Load the samples as float64 for the MNE steps that require it (filtering, ICA).
+
+        Call apply_precision() afterwards to return to the working precision.
+        """
+        self.ensure_loaded()
+        if self.raw is not None and self.raw._data.dtype != np.float64:
+            self.raw._data = self.raw._data.astype(np.float64)
+        self.refresh_data()
+
+    def mark_data_changed(self):
+        self.data_version += 1
+        self.spectral_engine.clear()  # spectra of older versions can never be asked for again
+        self.resampler.clear()
+
+    def refresh_data(self):
+        """Point data at the Raw's own sample buffer so raw, plots and workers share a single copy."""
+        if self.raw is not None and self.raw.preload:
+            self.data = self.raw._data
+        else:
+            self.data = None
+
+    def get_data(self, picks=None, start=0, stop=None, interpolate_artifacts=True):
+        """Return a (channels x samples) window, read from disk when the recording is lazy.
+
+        For a loaded recording this is a view into the shared buffer whenever picks is None or a
+        contiguous ascending run of channels; other picks return a copy of just those rows. Windows that
+        touch a marked artifact come back as a copy with the artifact samples interpolated.
+        """
+        window = self._read_window(picks, start, stop)
+        if not interpolate_artifacts or window is None or not len(self.artifacts):
+            return window
+
+        n_times = self.raw.n_times
+        first, last = self.artifacts.overlapping(start, n_times if stop is None else stop)
+        if first == last:
+            return window
+        if self.data is not None and np.may_share_memory(window, self.data):
+            window = window.copy()
+        return self.artifacts.apply(window, start, n_times,
+                                    lambda samples: self._read_samples(picks, samples))
+
+    def _read_samples(self, picks, samples):
+        """Un-interpolated values of the given channels at scattered sample indices."""
+        if self.data is not None:
+            rows = self.data if picks is None else self.data[list(picks)]
+            return rows[:, samples]
+        with self.read_lock:
+            columns = [self.raw.get_data(picks=picks, start=sample, stop=sample + 1)[:, 0] for sample in samples]
+        return np.column_stack(columns).astype(self.dtype, copy=False)
+
+    def _read_window(self, picks, start, stop):
         if self.data is not None:
+            if picks is None:
+                return self.data[:, start:stop]
+            picks = list(picks)
+            if picks and picks == list(range(picks[0], picks[-1] + 1)):
+                return self.data[picks[0]:picks[-1] + 1, start:stop]
+            return self.data[picks, start:stop]
+        if self.raw is None:
+            return None
+        # Clip to the recording like a slice of the loaded buffer would; MNE refuses reads past the end
+        stop = self.raw.n_times if stop is None else min(stop, self.raw.n_times)
+        start = min(start, stop)
+        if start == stop:
+            return np.empty((len(self.channel_names) if picks is None else len(list(picks)), 0), dtype=self.dtype)
+        step = max(int(self.read_chunk_duration * self.sf), 1)
+        window = None
+        for first in range(start, stop, step):
+            with self.read_lock:
+                chunk = self.raw.get_data(picks=picks, start=first, stop=min(first + step, stop))
+            if window is None:
+                window = np.empty((len(chunk), stop - start), dtype=self.dtype)
+            window[:, first - start:first - start + chunk.shape[1]] = chunk
+        return window
+
+    def add_artifacts(self, spans):
+        """Mark (start, stop) sample spans as artifacts; returns the merged intervals whose samples changed."""
+        spans = self.artifacts.add(spans)
+        if spans:
+            self._write_artifact_annotations()
+            self.mark_data_changed()
+        return spans
+
+    def undo_artifacts(self):
+        """Remove the most recently marked batch of artifacts; returns the intervals whose samples changed."""
+        spans = self.artifacts.undo()
+        if spans:
+            self._write_artifact_annotations()
+            self.mark_data_changed()
+        return spans
+
+    def reset_artifacts(self):
+        """Rebuild the artifact index from the BAD_artifact annotations of a newly loaded recording."""
+        spans = []
+        if self.raw is not None:
+            annotations = self.raw.annotations
+            origin = self.raw.first_time if annotations.orig_time is not None else 0.
+            for onset, duration, description in zip(annotations.onset, annotations.duration,
+                                                    annotations.description):
+                if description == 'BAD_artifact':
+                    start = int(round((onset - origin) * self.raw.info['sfreq']))
+                    spans.append((start, start + int(round(duration * self.raw.info['sfreq']))))
+        self.artifacts.set_spans(spans)
+
+    def _write_artifact_annotations(self):
+        annotations = self.raw.annotations
+        annotations.delete(np.flatnonzero(annotations.description == 'BAD_artifact'))
+        origin = self.raw.first_time if annotations.orig_time is not None else 0.
+        sfreq = self.raw.info['sfreq']
+        if len(self.artifacts):
+            annotations.append(self.artifacts.starts / sfreq + origin, (self.artifacts.stops - self.artifacts.starts) / sfreq,
+                               'BAD_artifact')
+
+    def calculate_kurtosis(self):
+        if self.raw is not None:
             # Calculate kurtosis for each channel
-            kurtosis_values = kurtosis(self.data, axis=1, fisher=False)
+            kurtosis_values = kurtosis(self.get_data(), axis=1, fisher=False)
             for ch_name, kurt_value in zip(self.channel_names, kurtosis_values):
                 print(f"Kurtosis for {ch_name}: {kurt_value:.4f}")
             return kurtosis_values
@@ -233,12 +406,12 @@ class EEGAnalyzer(QMainWindow):
                 QtWidgets.QMessageBox.critical(None, "Error", "Failed to load model.")
 
     def predict_events(self):
-        if self.data is None:
+        if self.raw is None:
             QMessageBox.warning(self, "Warning", "No EEG data available for prediction.")
             return
 
         # Use the predict method from ModelManager
-        predictions = self.model_manager.predict(self.data)
+        predictions = self.model_manager.predict(self.get_data())
 
         if predictions is not None:
             # Handle the predictions (e.g., display them, store them, etc.)
@@ -280,6 +453,8 @@ class EEGAnalyzer(QMainWindow):
         self.data = data
         self.channel_names = channel_names
         self.sf = sf
+        self.reset_artifacts()
+        self.mark_data_changed()
         self.channel_selector.populate_channel_selector()
         self.graph_manager.updateGraph()
         self.complexity_calculator.enable_complexity_button()  # Enable the button when data is loaded
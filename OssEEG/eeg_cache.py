@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+import mne
+import numpy as np
+from mne.io import BaseRaw
+
+logging.basicConfig(level=logging.WARNING)
+
+
+class RawCache(BaseRaw):
+    """Unloaded Raw whose samples come from a memory-mapped OssEEG cache file."""
+
+    def __init__(self, data_file, info, n_times, first_samp=0):
+        super().__init__(info, preload=False, first_samps=[first_samp], last_samps=[first_samp + n_times - 1],
+                         filenames=[data_file], raw_extras=[{'n_channels': info['nchan'], 'n_times': n_times}],
+                         orig_format='single', verbose=False)
+
+    def _read_segment_file(self, data, idx, fi, start, stop, cals, mult):
+        extras = self._raw_extras[fi]
+        # Map the file per read so copies of the Raw never carry an open mapping around
+        cached = np.memmap(self._filenames[fi], dtype='<f4', mode='r',
+                           shape=(extras['n_channels'], extras['n_times']))
+        block = cached[:, start:stop]
+        if mult is not None:
+            data[:] = mult @ np.asarray(block, dtype=data.dtype)[idx]
+        else:
+            data[:] = block[idx]
+            data *= cals.reshape(-1, 1)
+
+
+class EEGCache:
+    """Sidecar cache of a recording: channel-major float32 samples plus a small JSON metadata file.
+
+    The cache lives in ``<file>.osscache/`` and is only used while the source file, and the header and
+    marker files of a BrainVision recording, keep the size and modification time they had when the cache
+    was written.
+    """
+    version = 2
+    suffix = '.osscache'
+
+    def __init__(self, chunk_duration=10.):
+        self.chunk_duration = chunk_duration
+
+    def cache_dir(self, file_name):
+        return file_name + self.suffix
+
+    def _paths(self, file_name):
+        cache_dir = self.cache_dir(file_name)
+        return os.path.join(cache_dir, 'meta.json'), os.path.join(cache_dir, 'data.f32')
+
+    @staticmethod
+    def sidecar_files(file_name):
+        """Files besides file_name that the recording is read from: the .vhdr and .vmrk of a BrainVision .eeg."""
+        if not file_name.endswith('.eeg'):
+            return []
+        hdr_file = file_name[:-len('.eeg')] + '.vhdr'
+        marker_file = hdr_file[:-len('.vhdr')] + '.vmrk'
+        try:
+            with open(hdr_file, encoding='latin-1') as f:
+                for line in f:
+                    if line.strip().lower().startswith('markerfile='):
+                        marker_file = os.path.join(os.path.dirname(hdr_file), line.split('=', 1)[1].strip())
+                        break
+        except OSError:
+            pass
+        return [hdr_file, marker_file]
+
+    @staticmethod
+    def _stats(file_names):
+        """[[size, mtime_ns]] of each file; None for a file that does not exist."""
+        stats = []
+        for name in file_names:
+            try:
+                stat = os.stat(name)
+            except OSError:
+                stats.append(None)
+            else:
+                stats.append([stat.st_size, stat.st_mtime_ns])
+        return stats
+
+    def read_meta(self, file_name):
+        meta_file, data_file = self._paths(file_name)
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            stat = os.stat(file_name)
+        except (OSError, ValueError):
+            return None
+
+        if (meta.get('version') != self.version or meta['source_size'] != stat.st_size
+                or meta['source_mtime_ns'] != stat.st_mtime_ns):
+            return None
+        sidecars = self.sidecar_files(file_name)
+        if meta['sidecars'] != [[name, stats] for name, stats in zip(sidecars, self._stats(sidecars))]:
+            return None
+        n_bytes = len(meta['ch_names']) * meta['n_times'] * 4
+        if not os.path.exists(data_file) or os.path.getsize(data_file) != n_bytes:
+            return None
+        return meta
+
+    def is_valid(self, file_name):
+        return self.read_meta(file_name) is not None
+
+    def open(self, file_name):
+        """Open a valid cache as an unloaded Raw; only the header is read, samples are memory-mapped."""
+        meta = self.read_meta(file_name)
+        if meta is None:
+            raise FileNotFoundError(f"No valid cache for {file_name}")
+        _, data_file = self._paths(file_name)
+
+        info = mne.create_info(meta['ch_names'], meta['sfreq'], 'eeg')
+        if meta['meas_date'] is not None:
+            info.set_meas_date(datetime.fromisoformat(meta['meas_date']))
+        raw = RawCache(data_file, info, meta['n_times'], first_samp=meta['first_samp'])
+
+        montage = meta['montage']
+        if montage is not None:
+            fiducials = {key: np.array(montage[key]) if montage[key] is not None else None
+                         for key in ('nasion', 'lpa', 'rpa')}
+            ch_pos = {name: np.array(pos) for name, pos in montage['ch_pos'].items()}
+            raw.set_montage(mne.channels.make_dig_montage(ch_pos=ch_pos, coord_frame=montage['coord_frame'],
+                                                          **fiducials))
+
+        annotations = meta['annotations']
+        raw.set_annotations(mne.Annotations(annotations['onset'], annotations['duration'],
+                                            annotations['description'], orig_time=raw.info['meas_date']))
+        return raw
+
+    def write(self, file_name, raw, progress_callback=None, is_cancelled=None):
+        """Stream raw into the cache chunk by chunk; returns False if cancelled before completion."""
+        meta_file, data_file = self._paths(file_name)
+        os.makedirs(self.cache_dir(file_name), exist_ok=True)
+        if os.path.exists(meta_file):
+            os.remove(meta_file)  # an outdated header must never describe the new samples
+
+        n_channels, n_times = len(raw.ch_names), int(raw.n_times)
+        step = max(int(self.chunk_duration * raw.info['sfreq']), 1)
+        cached = np.memmap(data_file, dtype='<f4', mode='w+', shape=(n_channels, n_times))
+        for start in range(0, n_times, step):
+            if is_cancelled is not None and is_cancelled():
+                del cached
+                os.remove(data_file)
+                return False
+            stop = min(start + step, n_times)
+            cached[:, start:stop] = raw.get_data(start=start, stop=stop)
+            if progress_callback is not None:
+                progress_callback(stop, n_times)
+        cached.flush()
+        del cached
+
+        montage = raw.get_montage()
+        if montage is not None:
+            positions = montage.get_positions()
+            montage = {'coord_frame': positions['coord_frame'],
+                       'ch_pos': {name: pos.tolist() for name, pos in positions['ch_pos'].items()}}
+            for key in ('nasion', 'lpa', 'rpa'):
+                montage[key] = positions[key].tolist() if positions[key] is not None else None
+
+        stat = os.stat(file_name)
+        sidecars = self.sidecar_files(file_name)
+        meas_date = raw.info['meas_date']
+        meta = {'version': self.version,
+                'source_size': stat.st_size,
+                'source_mtime_ns': stat.st_mtime_ns,
+                'sidecars': [[name, stats] for name, stats in zip(sidecars, self._stats(sidecars))],
+                'ch_names': list(raw.ch_names),
+                'sfreq': float(raw.info['sfreq']),
+                'n_times': n_times,
+                'first_samp': int(raw.first_samp),
+                'meas_date': meas_date.isoformat() if meas_date is not None else None,
+                'montage': montage,
+                'annotations': {'onset': raw.annotations.onset.tolist(),
+                                'duration': raw.annotations.duration.tolist(),
+                                'description': raw.annotations.description.tolist()}}
+
+        # Write the header last and atomically so a half-written cache is never considered valid
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_file + '.tmp', meta_file)
+        return True
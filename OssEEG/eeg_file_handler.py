@@ -1,22 +1,48 @@
+import logging
 import os
 import mne
+import numpy as np
+
+from eeg_cache import EEGCache
+
+logging.basicConfig(level=logging.WARNING)
 
 
 class EEGFileHandler:
     def __init__(self):
         self.raw = None
         self.data = None
+        self.lazy = False  # keep the Raw on disk and read windows on demand
+        self.use_cache = True  # re-open recordings from their float32 sidecar cache
+        self.cache = EEGCache()
+
+    def load_file(self, file_name, preload=None):
+        if preload is None:
+            preload = not self.lazy
+
+        self.open_file(file_name)
+        if preload:
+            self.read_data(self.raw)
+            self.data = self.raw._data  # the Raw's own buffer, not a copy
+        else:
+            self.data = None  # samples are read on demand through EEGAnalyzer.get_data
+        return self.raw, self.data
+
+    def open_file(self, file_name):
+        """Parse the header, pick EEG channels and set the montage without reading any samples."""
+        if self.use_cache and self.cache.is_valid(file_name):
+            self.raw = self.cache.open(file_name)
+            return self.raw
 
-    def load_file(self, file_name):
         if file_name.endswith('.fif'):
-            self.raw = mne.io.read_raw_fif(file_name, preload=True)
+            self.raw = mne.io.read_raw_fif(file_name, preload=False)
         elif file_name.endswith('.eeg'):
             hdr_file = file_name.replace('.eeg', '.vhdr')
             if not os.path.exists(hdr_file):
                 raise FileNotFoundError(f"Header file not found: {hdr_file}")
-            self.raw = mne.io.read_raw_brainvision(hdr_file, preload=True)
+            self.raw = mne.io.read_raw_brainvision(hdr_file, preload=False)
         elif file_name.endswith('.edf'):
-            self.raw = mne.io.read_raw_edf(file_name, preload=True)
+            self.raw = mne.io.read_raw_edf(file_name, preload=False)
         else:
             raise ValueError('Unsupported file format')
 
@@ -26,6 +52,39 @@ class EEGFileHandler:
         if not self.raw.info['dig']:
             montage = mne.channels.make_standard_montage('standard_1020')
             self.raw.set_montage(montage)
+        return self.raw
 
-        self.data = self.raw.get_data()  # Get data for all channels
-        return self.raw, self.data
+    def write_cache(self, file_name, raw, progress_callback=None, is_cancelled=None):
+        """Write the sidecar cache for file_name unless caching is off or a valid one exists."""
+        if not self.use_cache or self.cache.is_valid(file_name):
+            return False
+        try:
+            return self.cache.write(file_name, raw, progress_callback, is_cancelled)
+        except OSError as e:
+            logging.warning(f"Could not write cache for {file_name}: {e}")
+            return False
+
+    def read_data(self, raw, dtype=np.float64, chunk_duration=10., progress_callback=None, is_cancelled=None):
+        """Read an opened recording into memory chunk by chunk, storing samples as dtype.
+
+        progress_callback(samples_read, n_times) is called after every chunk and is_cancelled() is
+        checked before each one; None is returned when the read was cancelled.
+        """
+        n_times = raw.n_times
+        step = max(int(chunk_duration * raw.info['sfreq']), 1)
+        data = np.empty((len(raw.ch_names), n_times), dtype=dtype)
+        for start in range(0, n_times, step):
+            if is_cancelled is not None and is_cancelled():
+                return None
+            stop = min(start + step, n_times)
+            data[:, start:stop] = raw.get_data(start=start, stop=stop)
+            if progress_callback is not None:
+                progress_callback(stop, n_times)
+
+        # Adopt the buffer the way BaseRaw.load_data does, so it stays the only full copy of the samples
+        # and keeps the requested precision (RawArray would force a float64 copy)
+        raw._data = data
+        raw.preload = True
+        raw.close()
+        self.raw = raw
+        return raw
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PageCache:
+    """LRU cache of fixed-length sample pages, read per channel through a reader(picks, start, stop).
+
+    Pages are stored per (row, page) so scrolling the channel axis only reads the rows that came into
+    view, and every read for a page fetches all of its missing rows in one call.
+    """
+
+    def __init__(self, reader, n_times, page_size, max_bytes=256 * 2 ** 20):
+        self.reader = reader
+        self.n_times = n_times
+        self.page_size = page_size
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()  # (row, page) -> samples, least recently used first
+        self.n_bytes = 0
+        self.dtype = np.float64
+
+    def page_range(self, start, stop):
+        return range(max(start, 0) // self.page_size, (min(stop, self.n_times) - 1) // self.page_size + 1)
+
+    def fetch(self, rows, page):
+        """Make sure page is cached for every row."""
+        missing = [row for row in rows if (row, page) not in self.pages]
+        if missing:
+            start = page * self.page_size
+            stop = min(start + self.page_size, self.n_times)
+            block = self.reader(missing, start, stop)
+            self.dtype = block.dtype
+            for row, values in zip(missing, block):
+                self.pages[(row, page)] = values.copy()  # don't let one row keep the whole block alive
+                self.n_bytes += values.nbytes
+        for row in rows:
+            self.pages.move_to_end((row, page))
+        while self.n_bytes > self.max_bytes and len(self.pages) > len(rows):
+            _, evicted = self.pages.popitem(last=False)
+            self.n_bytes -= evicted.nbytes
+
+    def read(self, rows, start, stop):
+        """Assemble the (rows x samples) window [start, stop) from cached pages."""
+        start, stop = max(start, 0), min(stop, self.n_times)
+        out = None
+        for page in self.page_range(start, stop):
+            self.fetch(rows, page)
+            page_start = page * self.page_size
+            lo, hi = max(start, page_start), min(stop, page_start + self.page_size)
+            if out is None:
+                out = np.empty((len(rows), max(stop - start, 0)), dtype=self.dtype)
+            for i, row in enumerate(rows):
+                out[i, lo - start:hi - start] = self.pages[(row, page)][lo - page_start:hi - page_start]
+        if out is None:
+            out = np.empty((len(rows), 0), dtype=self.dtype)
+        return out
+
+    def prefetch(self, rows, start, stop, n_pages=1):
+        """Read the pages just outside [start, stop) so the next scroll step is served from memory."""
+        pages = self.page_range(start, stop)
+        if not len(pages):
+            return
+        last_page = (self.n_times - 1) // self.page_size
+        for page in list(range(pages[0] - n_pages, pages[0])) + list(range(pages[-1] + 1, pages[-1] + 1 + n_pages)):
+            if 0 <= page <= last_page:
+                self.fetch(rows, page)
+
+    def invalidate(self, start, stop):
+        """Drop the cached pages overlapping samples [start, stop) so they are read again."""
+        pages = set(self.page_range(start, stop))
+        for key in [key for key in self.pages if key[1] in pages]:
+            self.n_bytes -= self.pages.pop(key).nbytes
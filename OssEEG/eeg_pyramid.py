@@ -0,0 +1,105 @@
+import numpy as np
+
+
+def window_envelope(values, start, n_pixels):
+    """Min/max envelope of a (rows x samples) window that starts at sample start, about one bin per pixel."""
+    bin_size = values.shape[1] // n_pixels if n_pixels > 0 else 0
+    if bin_size < 2:
+        return np.arange(start, start + values.shape[1]), values
+    edges = np.arange(0, values.shape[1], bin_size)
+    envelope = np.empty((len(values), 2 * len(edges)), dtype=values.dtype)
+    envelope[:, 0::2] = np.minimum.reduceat(values, edges, axis=1)
+    envelope[:, 1::2] = np.maximum.reduceat(values, edges, axis=1)
+    return np.repeat(start + edges + bin_size / 2, 2), envelope
+
+
+class MinMaxPyramid:
+    """Per-channel min/max envelopes of a recording at successively coarser resolutions.
+
+    The first level summarises bins of base_bin samples, every further level merges factor bins of the
+    level below, until fewer than min_bins bins remain. The finest resolution is the signal itself.
+    Samples are taken from reader(rows, start, stop), which defaults to slicing data, so that a view over
+    the recording (e.g. with artifacts interpolated) can be summarised without materialising it.
+    """
+
+    def __init__(self, data, reader=None, base_bin=16, factor=4, min_bins=256, chunk_bins=4096):
+        self.data = data  # kept by reference, used when zoomed in past the first level
+        self.reader = reader if reader is not None else (
+            lambda rows, start, stop: data[:, start:stop] if rows is None else data[rows, start:stop])
+        self.n_times = data.shape[1]
+        self.base_bin = base_bin
+        self.factor = factor
+        self.chunk_size = base_bin * chunk_bins
+        self.levels = []  # (bin_size, mins, maxs), finest first
+
+        n_bins = -(-self.n_times // base_bin)
+        mins = np.empty((data.shape[0], n_bins), dtype=data.dtype)
+        maxs = np.empty((data.shape[0], n_bins), dtype=data.dtype)
+        self.levels.append((base_bin, mins, maxs))
+        self._summarise(0, self.n_times)
+
+        bin_size = base_bin
+        while self.n_times > bin_size * factor * min_bins:
+            edges = np.arange(0, mins.shape[1], factor)
+            mins = np.minimum.reduceat(mins, edges, axis=1)
+            maxs = np.maximum.reduceat(maxs, edges, axis=1)
+            bin_size *= factor
+            self.levels.append((bin_size, mins, maxs))
+
+        _, top_mins, top_maxs = self.levels[-1]
+        self.max_abs = float(np.nanmax(np.maximum(np.abs(top_mins), np.abs(top_maxs)))) if data.size else 0.
+
+    def _summarise(self, start, stop):
+        """Recompute the first-level bins covering samples [start, stop), reading one chunk at a time."""
+        _, mins, maxs = self.levels[0]
+        first = start // self.base_bin
+        last = -(-stop // self.base_bin)
+        for chunk_start in range(first * self.base_bin, last * self.base_bin, self.chunk_size):
+            chunk_stop = min(chunk_start + self.chunk_size, last * self.base_bin, self.n_times)
+            values = self.reader(None, chunk_start, chunk_stop)
+            edges = np.arange(0, values.shape[1], self.base_bin)
+            bins = slice(chunk_start // self.base_bin, chunk_start // self.base_bin + len(edges))
+            mins[:, bins] = np.minimum.reduceat(values, edges, axis=1)
+            maxs[:, bins] = np.maximum.reduceat(values, edges, axis=1)
+
+    def update(self, start, stop):
+        """Refresh the bins of every level that cover samples [start, stop) after those samples changed."""
+        start, stop = max(int(start), 0), min(int(stop), self.n_times)
+        if stop <= start:
+            return
+        self._summarise(start, stop)
+        first, last = start // self.base_bin, -(-stop // self.base_bin)
+        for (_, lower_mins, lower_maxs), (_, mins, maxs) in zip(self.levels, self.levels[1:]):
+            first, last = first // self.factor, -(-last // self.factor)
+            lower = slice(first * self.factor, min(last * self.factor, lower_mins.shape[1]))
+            edges = np.arange(0, lower.stop - lower.start, self.factor)
+            mins[:, first:first + len(edges)] = np.minimum.reduceat(lower_mins[:, lower], edges, axis=1)
+            maxs[:, first:first + len(edges)] = np.maximum.reduceat(lower_maxs[:, lower], edges, axis=1)
+
+    def select_level(self, n_samples, n_pixels):
+        """Return the coarsest level that still has at least one bin per pixel, or None for the raw signal."""
+        selected = None
+        for level in self.levels:
+            if n_samples / level[0] < n_pixels:
+                break
+            selected = level
+        return selected
+
+    def envelope(self, rows, start, stop, n_pixels):
+        """Return (sample positions, values per row) tracing the rows' envelope over [start, stop)."""
+        start = max(int(start), 0)
+        stop = min(int(stop), self.n_times)
+        if stop <= start:
+            return np.empty(0), np.empty((len(rows), 0))
+
+        level = self.select_level(stop - start, n_pixels)
+        if level is None:
+            return np.arange(start, stop), self.reader(list(rows), start, stop)
+
+        bin_size, mins, maxs = level
+        first, last = start // bin_size, -(-stop // bin_size)
+        values = np.empty((len(rows), 2 * (last - first)), dtype=mins.dtype)
+        values[:, 0::2] = mins[rows, first:last]
+        values[:, 1::2] = maxs[rows, first:last]
+        positions = np.repeat(np.arange(first, last) * bin_size + bin_size / 2, 2)
+        return positions, values
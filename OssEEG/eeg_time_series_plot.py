@@ -2,7 +2,14 @@ import numpy as np
 import pyqtgraph as pg
 from PyQt6 import QtWidgets, QtGui, QtCore
 
+from eeg_pager import PageCache
+from eeg_pyramid import MinMaxPyramid, window_envelope
+from stacked_channels_item import StackedChannelsItem
+
 class EEGTimeSeriesPlot(QtWidgets.QWidget):
+    artifactRegionsMarked = QtCore.pyqtSignal(list)  # [(start, stop)] in samples
+    undoArtifactsRequested = QtCore.pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.plotWidget = None
@@ -11,7 +18,20 @@ class EEGTimeSeriesPlot(QtWidgets.QWidget):
         self.data = None
         self.sf = None
         self.channel_names = None
-        self.max_display_channels = 20
+        self.data_version = None
+        self.pyramid = None
+        self.pager = None  # set instead of pyramid when browsing a lazily loaded recording
+        self.reader = None
+        self.n_times = 0
+        self.amplitude = 1.
+        self.page_duration = 10.  # seconds per page, also the initial window in paged mode
+        self.max_paged_duration = 60.  # widest window that paged mode will read
+        self.prefetch_pages = 1
+        self.channelsItem = StackedChannelsItem(pen='k')  # Set pen color to black
+        self.channel_rows = np.empty(0, dtype=int)
+        self.channel_offsets = np.empty(0)
+        self.row_height = 1.
+        self.initial_display_channels = 20  # rows shown before the user scrolls the channel axis
         self.isScrollMode = True
         self.regions = []
 
@@ -27,8 +47,11 @@ class EEGTimeSeriesPlot(QtWidgets.QWidget):
         self.plotWidget.getAxis('bottom').setTextPen('k')
         self.plotWidget.showGrid(x=True, y=True, alpha=0.5)
 
-        self.plotWidget.setDownsampling(mode='peak')
-        self.plotWidget.setClipToView(True)
+        # Curves are fed from the min/max pyramid at the resolution of the visible range (see refreshCurves)
+        # Scrolling the channel axis alone leaves the samples of the rows already drawn as they were
+        self.plotWidget.getViewBox().sigXRangeChanged.connect(lambda *args: self.refreshCurves())
+        self.plotWidget.getViewBox().sigYRangeChanged.connect(lambda *args: self.refreshCurves(keep_paths=True))
+        self.plotWidget.getViewBox().sigResized.connect(lambda *args: self.refreshCurves())
         self.plotWidget.setMouseEnabled(x=True, y=True)
         self.plotWidget.setMenuEnabled(True)
         self.plotWidget.setLimits(xMin=0, xMax=None, yMin=0, yMax=None)
@@ -45,10 +68,15 @@ class EEGTimeSeriesPlot(QtWidgets.QWidget):
         self.removeRegionsButton.setFixedSize(200, 50)
         self.removeRegionsButton.clicked.connect(self.removeRegions)
 
+        self.undoInterpolationButton = QtWidgets.QPushButton("Undo Interpolation")
+        self.undoInterpolationButton.setFixedSize(200, 50)
+        self.undoInterpolationButton.clicked.connect(self.undoArtifactsRequested.emit)
+
         layout.addWidget(self.plotWidget)
         layout.addWidget(self.toggleButton)
         layout.addWidget(self.addRegionButton)
         layout.addWidget(self.removeRegionsButton)
+        layout.addWidget(self.undoInterpolationButton)
         self.setLayout(layout)
 
     def toggleMode(self):
@@ -66,67 +94,134 @@ class EEGTimeSeriesPlot(QtWidgets.QWidget):
         self.regions.append(region)
 
     def removeRegions(self):
+        """Hand the marked regions over as sample spans; the recording itself is left untouched."""
+        spans = []
         for region in self.regions:
-            self.interpolateArtifactRegion(region.getRegion())
+            start, end = region.getRegion()
+            spans.append((max(int(start * self.sf), 0), min(int(end * self.sf), self.n_times)))
             self.plotWidget.removeItem(region)
         self.regions = []
-        self.updatePlot(self.selected_channel_names)  # Refresh the plot with updated data
-
-    def interpolateArtifactRegion(self, region):
-        start, end = region
-        start_idx = int(start * self.sf)
-        end_idx = int(end * self.sf)
-        for ch_idx in range(self.data.shape[0]):
-            self.data[ch_idx, start_idx:end_idx] = self.interpolate(self.data[ch_idx, :], start_idx, end_idx)
-
-    def interpolate(self, data, start_idx, end_idx):
-        """Linearly interpolate the data between start_idx and end_idx."""
-        if start_idx == 0:
-            start_val = data[end_idx]
-        else:
-            start_val = data[start_idx - 1]
-
-        if end_idx == len(data):
-            end_val = data[start_idx - 1]
-        else:
-            end_val = data[end_idx]
-
-        interp_values = np.linspace(start_val, end_val, end_idx - start_idx)
-        return interp_values
-
-    def plot(self, data, sf, channel_names, selected_channels):
+        if spans:
+            self.artifactRegionsMarked.emit(spans)
+
+    def refreshSpans(self, spans, data_version=None):
+        """Redraw after the samples in spans changed, re-reading only what covers them."""
+        for start, stop in spans:
+            if self.pyramid is not None:
+                self.pyramid.update(start, stop)
+            if self.pager is not None:
+                self.pager.invalidate(start, stop)
+        self.data_version = data_version
+        self.refreshCurves()
+
+    def plot(self, data, sf, channel_names, selected_channels, data_version=None, reader=None):
+        """Plot a loaded recording; reader(picks, start, stop), if given, is used instead of slicing data."""
+        if (self.pyramid is None or data is not self.data or reader != self.reader or data_version is None
+                or data_version != self.data_version):
+            self.pyramid = MinMaxPyramid(data, reader)  # built once per data version
+        self.pager = None
+        self.reader = reader
         self.data = data
+        self.n_times = data.shape[1]
+        self.amplitude = self.pyramid.max_abs
+        self.sf = sf
+        self.channel_names = channel_names
+        self.data_version = data_version
+        self.selected_channel_names = selected_channels
+        self.channel_rows = np.empty(0, dtype=int)  # nothing to refresh until updatePlot has laid out the rows
+        self.plotWidget.setLimits(maxXRange=None)
+        self.plotWidget.setXRange(0, self.n_times / self.sf, padding=0)
+        self.updatePlot(selected_channels)
+
+    def plotPaged(self, reader, n_times, sf, channel_names, selected_channels, data_version=None):
+        """Browse a recording that is not in memory: only the visible window and its neighbours are read.
+
+        reader(picks, start, stop) returns a (channels x samples) window, e.g. EEGAnalyzer.get_data.
+        """
+        if (self.pager is None or self.pager.reader != reader or data_version is None
+                or data_version != self.data_version):
+            self.pager = PageCache(reader, n_times, max(int(self.page_duration * sf), 1))
+            # Scale from the first page, the whole recording is never read in this mode
+            first_page = self.pager.read([channel_names.index(ch) for ch in selected_channels], 0,
+                                         self.pager.page_size)
+            self.amplitude = float(np.nanmax(np.abs(first_page))) if first_page.size else 1.
+        self.pyramid = None
+        self.reader = reader
+        self.data = None
+        self.n_times = n_times
         self.sf = sf
         self.channel_names = channel_names
+        self.data_version = data_version
         self.selected_channel_names = selected_channels
+        self.channel_rows = np.empty(0, dtype=int)
+        self.plotWidget.setLimits(maxXRange=self.max_paged_duration)
+        self.plotWidget.setXRange(0, min(self.page_duration, n_times / sf), padding=0)
         self.updatePlot(selected_channels)
 
     def updatePlot(self, selected_channels):
         if not selected_channels:
             return
 
-        selected_channels = selected_channels[:self.max_display_channels]
-
         self.plotWidget.clear()
-        time = np.arange(self.data.shape[1]) / self.sf
-        offset = 0
-        self.curves = []
-        max_amplitude = np.nanmax(np.abs(self.data))  # Max amplitude for scaling
+        self.plotWidget.addItem(self.channelsItem)
+        self.plotWidget.setLabel('bottom', 'Time (s)', color='k')
+        self.plotWidget.setLabel('left', 'Amplitude (uV)', color='k')
+        self.layoutChannels(selected_channels)
+
+        # Show the first rows; the rest of the channel axis is reached by scrolling
+        n_shown = min(len(selected_channels), self.initial_display_channels)
+        self.plotWidget.setYRange(0, n_shown * self.amplitude * 2 + self.amplitude)
+        self.refreshCurves()
+
+    def isShowing(self, data_version):
+        """Whether the plot is on screen with rows laid out for this version of the data."""
+        return (self.parent() is not None and len(self.channel_rows) > 0 and data_version is not None
+                and data_version == self.data_version and (self.pyramid is not None or self.pager is not None))
+
+    def setSelectedChannels(self, selected_channels):
+        """Re-stack the rows for a new selection without rebuilding the plot or re-reading drawn channels."""
+        self.selected_channel_names = selected_channels
+        self.layoutChannels(selected_channels)
+        self.refreshCurves(keep_paths=True)
+
+    def layoutChannels(self, selected_channels):
+        max_amplitude = self.amplitude  # Max amplitude for scaling, cached per data version
         margin = max_amplitude  # Add margin at the bottom
 
-        for i, ch_name in enumerate(selected_channels):
-            ch_idx = self.channel_names.index(ch_name)
-            ch_data = self.data[ch_idx, :] + offset + margin  # Add margin to each channel
-            curve = self.plotWidget.plot(time, ch_data, pen='k')  # Set pen color to black
-            self.curves.append(curve)
-            offset += max_amplitude * 2  # Adjust the offset for stacking
+        self.channel_rows = np.array([self.channel_names.index(ch_name) for ch_name in selected_channels])
+        self.channel_offsets = np.arange(len(selected_channels)) * max_amplitude * 2 + margin  # Stack the channels
+        self.row_height = max_amplitude
+        offset = len(selected_channels) * max_amplitude * 2
+        self.plotWidget.setLimits(yMax=offset + margin)
 
-        self.plotWidget.setLabel('bottom', 'Time (s)', color='k')
-        self.plotWidget.setLabel('left', 'Amplitude (uV)', color='k')
+        # Label each channel on the y-axis; labels that would overlap are dropped from the finer level
+        yticks = [(y, ch) for y, ch in zip(self.channel_offsets, selected_channels)]
+        stride = max(len(yticks) // self.initial_display_channels, 1)
+        self.plotWidget.getAxis('left').setTicks([yticks[::stride], yticks])
 
-        # Set the y-axis range to fit the data
-        self.plotWidget.setYRange(0, offset + margin)
+    def refreshCurves(self, keep_paths=False):
+        """Hand the renderer the envelope of the visible channels at the resolution of the visible range.
 
-        # Label each channel on the y-axis
-        yticks = [(i * max_amplitude * 2 + margin, ch) for i, ch in enumerate(selected_channels)]
-        self.plotWidget.getAxis('left').setTicks([yticks])
+        keep_paths=True is only valid when neither the data nor the x-range changed since the last call.
+        """
+        if (self.pyramid is None and self.pager is None) or not len(self.channel_rows):
+            return
+        view_box = self.plotWidget.getViewBox()
+        (x_min, x_max), (y_min, y_max) = view_box.viewRange()
+        n_pixels = max(int(view_box.width()), 100)
+        start, stop = int(np.floor(x_min * self.sf)), int(np.ceil(x_max * self.sf)) + 1
+
+        # Virtualised channel axis: rows scrolled out of view are neither read nor drawn
+        visible = np.flatnonzero((self.channel_offsets + self.row_height >= y_min) &
+                                 (self.channel_offsets - self.row_height <= y_max))
+        rows = self.channel_rows[visible]
+        if self.pager is not None:
+            start, stop = max(start, 0), min(stop, self.n_times)
+            positions, values = window_envelope(self.pager.read(list(rows), start, stop), start, n_pixels)
+            # Read the neighbouring pages once control is back in the event loop, after this frame is drawn
+            QtCore.QTimer.singleShot(0, lambda: self.pager is not None and
+                                     self.pager.prefetch(list(rows), start, stop, self.prefetch_pages))
+        else:
+            positions, values = self.pyramid.envelope(rows, start, stop, n_pixels)
+        self.channelsItem.setData(positions / self.sf, values, self.channel_offsets[visible], self.row_height,
+                                  keys=rows, keep_paths=keep_paths)
@@ -0,0 +1,44 @@
+import numpy as np
+from PyQt6 import QtCore
+
+
+class FileLoadWorker(QtCore.QThread):
+    progressChanged = QtCore.pyqtSignal(int, int)  # samples read, total samples
+    stageChanged = QtCore.pyqtSignal(str)
+    loadFinished = QtCore.pyqtSignal(object, object)  # raw, data (None when lazy)
+    loadFailed = QtCore.pyqtSignal(str)
+
+    def __init__(self, file_handler, file_path, preload, dtype=np.float64, parent=None):
+        super().__init__(parent)
+        self.file_handler = file_handler
+        self.file_path = file_path
+        self.preload = preload
+        self.dtype = dtype
+
+    def run(self):
+        try:
+            self.stageChanged.emit("Reading header...")
+            raw = self.file_handler.open_file(self.file_path)
+            data = None
+            if self.preload:
+                self.stageChanged.emit("Reading samples...")
+                raw = self.file_handler.read_data(raw, self.dtype, progress_callback=self.progressChanged.emit,
+                                                  is_cancelled=self.isInterruptionRequested)
+                if raw is None:  # cancelled by the user
+                    return
+                self.stageChanged.emit("Writing cache...")
+                self.file_handler.write_cache(self.file_path, raw, self.progressChanged.emit,
+                                              self.isInterruptionRequested)
+                data = raw._data  # share the Raw's buffer instead of copying it
+            else:
+                self.stageChanged.emit("Writing cache...")
+                if self.file_handler.write_cache(self.file_path, raw, self.progressChanged.emit,
+                                                 self.isInterruptionRequested):
+                    raw = self.file_handler.open_file(self.file_path)  # serve lazy reads from the memory map
+            self.file_handler.data = data
+        except Exception as e:
+            self.loadFailed.emit(str(e))
+            return
+
+        if not self.isInterruptionRequested():
+            self.loadFinished.emit(raw, data)
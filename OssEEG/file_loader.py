@@ -1,9 +1,15 @@
-from PyQt6 import QtWidgets
+import os
+
+from PyQt6 import QtWidgets, QtCore
+
+from file_load_worker import FileLoadWorker
 
 
 class FileLoader:
     def __init__(self, eeg_analyzer):
         self.eeg_analyzer = eeg_analyzer
+        self.load_worker = None
+        self.progressDialog = None
 
     def loadFile(self, file_path=None):
         if not file_path:
@@ -11,12 +17,61 @@ class FileLoader:
                 self.eeg_analyzer, "Open EEG File", "", "EEG Files (*.fif *.eeg *.edf);;All Files (*)")
 
         if file_path:
-            try:
-                self.eeg_analyzer.raw, self.eeg_analyzer.data = self.eeg_analyzer.file_handler.load_file(file_path)
-                self.eeg_analyzer.sf = int(self.eeg_analyzer.raw.info['sfreq'])
-                self.eeg_analyzer.channel_names = self.eeg_analyzer.raw.info['ch_names']
-                self.eeg_analyzer.channel_selector.populate_channel_selector()
-                self.eeg_analyzer.graph_manager.display_data()
-                self.eeg_analyzer.ica_manager.enable_ica_button()
-            except Exception as e:
-                QtWidgets.QMessageBox.critical(self.eeg_analyzer, "File Load Error", str(e))
+            self.cancelLoad()
+
+            self.progressDialog = QtWidgets.QProgressDialog(f"Loading {os.path.basename(file_path)}...", "Cancel",
+                                                            0, 0, self.eeg_analyzer)
+            self.progressDialog.setWindowTitle("Loading EEG File")
+            self.progressDialog.setWindowModality(QtCore.Qt.WindowModality.WindowModal)
+            self.progressDialog.setMinimumDuration(0)
+            self.progressDialog.canceled.connect(self.cancelLoad)
+
+            preload = not self.eeg_analyzer.file_handler.lazy
+            self.load_worker = FileLoadWorker(self.eeg_analyzer.file_handler, file_path, preload,
+                                              self.eeg_analyzer.dtype)
+            self.load_worker.progressChanged.connect(self.updateProgress)
+            self.load_worker.stageChanged.connect(self.updateStage)
+            self.load_worker.loadFinished.connect(self.handleLoadFinished)
+            self.load_worker.loadFailed.connect(self.handleLoadFailed)
+            self.load_worker.start()
+
+    def cancelLoad(self):
+        if self.load_worker is not None and self.load_worker.isRunning():
+            self.load_worker.requestInterruption()
+            self.load_worker.wait()
+        self.load_worker = None
+        self.closeProgressDialog()
+
+    def updateProgress(self, samples_read, n_times):
+        if self.progressDialog is not None:
+            self.progressDialog.setMaximum(n_times)
+            self.progressDialog.setValue(samples_read)
+
+    def updateStage(self, text):
+        if self.progressDialog is not None:
+            self.progressDialog.setLabelText(text)
+            self.progressDialog.setValue(0)
+
+    def handleLoadFinished(self, raw, data):
+        self.closeProgressDialog()
+        try:
+            self.eeg_analyzer.raw, self.eeg_analyzer.data = raw, data
+            self.eeg_analyzer.reset_artifacts()
+            self.eeg_analyzer.mark_data_changed()
+            self.eeg_analyzer.sf = int(self.eeg_analyzer.raw.info['sfreq'])
+            self.eeg_analyzer.channel_names = self.eeg_analyzer.raw.info['ch_names']
+            self.eeg_analyzer.channel_selector.populate_channel_selector()
+            self.eeg_analyzer.graph_manager.display_data()
+            self.eeg_analyzer.ica_manager.enable_ica_button()
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self.eeg_analyzer, "File Load Error", str(e))
+
+    def handleLoadFailed(self, message):
+        self.closeProgressDialog()
+        QtWidgets.QMessageBox.critical(self.eeg_analyzer, "File Load Error", message)
+
+    def closeProgressDialog(self):
+        if self.progressDialog is not None:
+            self.progressDialog.canceled.disconnect(self.cancelLoad)
+            self.progressDialog.close()
+            self.progressDialog = None
@@ -3,6 +3,7 @@ from eeg_time_series_plot import EEGTimeSeriesPlot
 from welch_analysis_plot import WelchAnalysisPlot
 from specparam_analysis_plot import SpecparamAnalysisPlot
 from multitaper_psd_plot import MultitaperPSDPlot
+from spectrogram_plot import SpectrogramPlot
 
 class GraphManager:
     def __init__(self, eeg_analyzer):
@@ -11,37 +12,50 @@ class GraphManager:
     def initUI(self, layout):
         self.graphSelector = QtWidgets.QComboBox()
         self.graphSelector.addItems(
-            ["Time Series", "Welch Analysis", "Specparam Analysis", "Multitaper PSD"])
+            ["Time Series", "Welch Analysis", "Specparam Analysis", "Multitaper PSD", "Spectrogram"])
         self.graphSelector.currentIndexChanged.connect(self.updateGraph)
         layout.addWidget(self.graphSelector)
 
         self.eegTimeSeriesPlot = EEGTimeSeriesPlot()
+        self.eegTimeSeriesPlot.artifactRegionsMarked.connect(self.markArtifacts)
+        self.eegTimeSeriesPlot.undoArtifactsRequested.connect(self.undoArtifacts)
         self.welchAnalysisPlot = WelchAnalysisPlot(self.eeg_analyzer.band_d)
         self.specparamAnalysisPlot = SpecparamAnalysisPlot()
         self.specparamAnalysisPlot.eeg_analyzer = self.eeg_analyzer  # Set the reference to the EEGAnalyzer
         self.multitaperPSDPlot = MultitaperPSDPlot(self.eeg_analyzer.band_d)
+        self.spectrogramPlot = SpectrogramPlot(self.eeg_analyzer.band_d)
 
         self.graphLayout = QtWidgets.QVBoxLayout()
         layout.addLayout(self.graphLayout)
 
     def updateGraph(self):
         self.clearLayout(self.graphLayout)
-        selected_channels = [item.text() for item in self.eeg_analyzer.channel_selector.channelSelector.selectedItems()]
+        selected_channels = self.eeg_analyzer.channel_selector.selected_channels()
+        current_graph = self.graphSelector.currentText()
+        if current_graph != "Multitaper PSD" or not selected_channels:
+            self.multitaperPSDPlot.cancel()  # only estimate what is being looked at
+        if current_graph != "Spectrogram" or not selected_channels:
+            self.spectrogramPlot.cancel()
         if not selected_channels:
             return
-        if len(selected_channels) > self.eegTimeSeriesPlot.max_display_channels:
-            selected_channels = selected_channels[:self.eegTimeSeriesPlot.max_display_channels]
 
-        current_graph = self.graphSelector.currentText()
         if current_graph == "Time Series":
             self.graphLayout.addWidget(self.eegTimeSeriesPlot)
-            self.eegTimeSeriesPlot.plot(self.eeg_analyzer.data, self.eeg_analyzer.sf, self.eeg_analyzer.channel_names, selected_channels)
+            if self.eeg_analyzer.data is not None:
+                self.eegTimeSeriesPlot.plot(self.eeg_analyzer.data, self.eeg_analyzer.sf, self.eeg_analyzer.channel_names, selected_channels,
+                                            self.eeg_analyzer.data_version, reader=self.eeg_analyzer.get_data)
+            else:
+                # Lazy recording: page in only the visible window of the displayed channels
+                self.eegTimeSeriesPlot.plotPaged(self.eeg_analyzer.get_data, self.eeg_analyzer.raw.n_times, self.eeg_analyzer.sf,
+                                                 self.eeg_analyzer.channel_names, selected_channels,
+                                                 self.eeg_analyzer.data_version)
             self.eeg_analyzer.complexity_calculator.enable_complexity_button()
             self.eeg_analyzer.ica_manager.enable_ica_button()
         elif current_graph == "Welch Analysis":
             self.graphLayout.addWidget(self.welchAnalysisPlot)
             selected_indices = [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
-            self.welchAnalysisPlot.plot(self.eeg_analyzer.data[selected_indices], self.eeg_analyzer.sf)
+            self.welchAnalysisPlot.plot(*self.eeg_analyzer.spectral_engine.welch(
+                self.eeg_analyzer.data_version, selected_indices, self.eeg_analyzer.get_data, self.eeg_analyzer.sf))
             self.eeg_analyzer.complexity_calculator.enable_complexity_button()
             self.eeg_analyzer.ica_manager.enable_ica_button()
         elif current_graph == "Specparam Analysis":
@@ -52,7 +66,29 @@ class GraphManager:
         elif current_graph == "Multitaper PSD":
             self.graphLayout.addWidget(self.multitaperPSDPlot)
             selected_indices = [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
-            self.multitaperPSDPlot.plot(self.eeg_analyzer.data[selected_indices], self.eeg_analyzer.sf)
+            self.multitaperPSDPlot.plot(self.eeg_analyzer.spectral_engine, self.eeg_analyzer.data_version, selected_indices,
+                                        self.eeg_analyzer.get_data, self.eeg_analyzer.sf)
+        elif current_graph == "Spectrogram":
+            self.graphLayout.addWidget(self.spectrogramPlot)
+            selected_indices = [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
+            self.spectrogramPlot.plot(self.eeg_analyzer.spectral_engine, self.eeg_analyzer.data_version, selected_indices,
+                                      self.eeg_analyzer.get_data, self.eeg_analyzer.sf, self.eeg_analyzer.raw.n_times)
+
+    def updateSelection(self, selected_channels):
+        """Follow a change of channel selection, redrawing only what depends on it."""
+        if (selected_channels and self.graphSelector.currentText() == "Time Series"
+                and self.eegTimeSeriesPlot.isShowing(self.eeg_analyzer.data_version)):
+            self.eegTimeSeriesPlot.setSelectedChannels(selected_channels)
+        else:
+            self.updateGraph()
+
+    def markArtifacts(self, spans):
+        spans = self.eeg_analyzer.add_artifacts(spans)
+        self.eegTimeSeriesPlot.refreshSpans(spans, self.eeg_analyzer.data_version)
+
+    def undoArtifacts(self):
+        spans = self.eeg_analyzer.undo_artifacts()
+        self.eegTimeSeriesPlot.refreshSpans(spans, self.eeg_analyzer.data_version)
 
     @staticmethod
     def clearLayout(layout):
@@ -77,6 +77,7 @@ class ICAManager(QtWidgets.QWidget):
         self.icaButton.setEnabled(True)
 
     def run_ica(self):
+        self.eeg_analyzer.to_full_precision()  # ICA is fitted in float64
         self.show_loading_indicator()
         self.eeg_analyzer.ica_thread = ICAWorker(self.eeg_analyzer.raw)
         self.eeg_analyzer.ica_thread.icaFinished.connect(self.handle_ica_finished)
@@ -84,6 +85,8 @@ class ICAManager(QtWidgets.QWidget):
 
     def handle_ica_finished(self, ica, ica_fig):
         self.hide_loading_indicator()
+        self.eeg_analyzer.apply_precision()
+        self.eeg_analyzer.mark_data_changed()  # the worker band-passes the Raw in place
         self.eeg_analyzer.ica = ica
         self.clearLayout(self.icaPlotLayout)
         self.canvas = FigureCanvas(ica_fig)
@@ -194,8 +197,10 @@ class ICAManager(QtWidgets.QWidget):
         self.update_data_excluding_ica()
 
     def update_data_excluding_ica(self):
+        self.eeg_analyzer.to_full_precision()
         self.eeg_analyzer.ica.apply(self.eeg_analyzer.raw, exclude=self.eeg_analyzer.ica_exclude)
-        self.eeg_analyzer.data = self.eeg_analyzer.raw.get_data()
+        self.eeg_analyzer.apply_precision()  # apply() edits the Raw in place
+        self.eeg_analyzer.mark_data_changed()
         self.eeg_analyzer.graph_manager.display_data()
 
     @staticmethod
@@ -50,7 +50,7 @@ class ModelManager:
             return
 
         # Prepare data for prediction
-        data = self.eeg_analyzer.data
+        data = self.eeg_analyzer.get_data()
         data = data.reshape(data.shape[0], -1)
         if data.shape[1] > 29049:
             data = data[:, :29049]  #hardcoded bug fix, should look into this
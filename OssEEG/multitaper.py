@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.signal import windows
+
+from process_pool import pool_size, run_tasks
+
+TAPER_CACHE_BYTES = 256 * 2 ** 20  # per process: the GUI and every pool worker keep their own tapers
+_tapers = OrderedDict()  # (n_times, half_nbw, low_bias) -> (tapers, eigvals)
+_tapers_bytes = 0
+_tapers_lock = threading.Lock()
+
+
+def dpss_tapers(n_times, half_nbw, low_bias=True):
+    """DPSS tapers and their eigenvalues for a signal length and normalised half-bandwidth, as mne's dpss_windows.
+
+    Kept in an LRU of at most TAPER_CACHE_BYTES; a taper set larger than that is computed every time.
+    """
+    global _tapers_bytes
+    key = (n_times, half_nbw, low_bias)
+    with _tapers_lock:
+        if key in _tapers:
+            _tapers.move_to_end(key)
+            return _tapers[key]
+
+    tapers, eigvals = windows.dpss(n_times, half_nbw, int(2 * half_nbw), sym=False, return_ratios=True)
+    if low_bias:
+        # Only the well-concentrated tapers; if there are none, the best one
+        keep = eigvals > 0.9 if (eigvals > 0.9).any() else [np.argmax(eigvals)]
+        tapers, eigvals = tapers[keep], eigvals[keep]
+    tapers.flags.writeable = False
+    eigvals.flags.writeable = False
+
+    with _tapers_lock:
+        if key not in _tapers and tapers.nbytes <= TAPER_CACHE_BYTES:
+            _tapers[key] = tapers, eigvals
+            _tapers_bytes += tapers.nbytes + eigvals.nbytes
+            while _tapers_bytes > TAPER_CACHE_BYTES:
+                _, (evicted, evicted_eigvals) = _tapers.popitem(last=False)
+                _tapers_bytes -= evicted.nbytes + evicted_eigvals.nbytes
+    return tapers, eigvals
+
+
+def multitaper_psd(data, sf, fmax=np.inf, bandwidth=None, adaptive=True, low_bias=True, n_jobs=1,
+                   max_iter=150, max_tapers=64):
+    """Multitaper PSDs of every row of data, (psd, freqs), like mne's psd_array_multitaper(normalization='full').
+
+    The tapers are computed once per (n_times, bandwidth) and all channels go through one batched FFT.
+    Adaptive weights are iterated for all channels and frequencies together. With n_jobs > 1 blocks of
+    channels are spread over the shared process pool, where every worker computes (and caches) the tapers
+    itself rather than receiving them with each block. The number of tapers grows with bandwidth times
+    duration; more than max_tapers is refused, since their cost is out of proportion for a display.
+    """
+    data = np.atleast_2d(data)
+    n_times = data.shape[-1]
+    half_nbw = 4. if bandwidth is None else float(bandwidth) * n_times / (2. * sf)
+    if half_nbw < 0.5:
+        raise ValueError(f"bandwidth {bandwidth} is below the resolution of the signal, use at least {sf / n_times}")
+    if int(2 * half_nbw) > max_tapers:
+        raise ValueError(f"bandwidth {bandwidth} Hz needs {int(2 * half_nbw)} tapers over {n_times / sf:.0f} s, "
+                         f"use at most {max_tapers * sf / n_times:.3g} Hz")
+    freqs = np.fft.rfftfreq(n_times, 1. / sf)
+    freq_mask = freqs <= fmax
+
+    n_jobs = min(n_jobs, len(data))
+    if n_jobs > 1:
+        parts = [None] * n_jobs
+        run_tasks([(_multitaper_block, (block, half_nbw, low_bias, freq_mask, adaptive, max_iter))
+                   for block in np.array_split(data, n_jobs)], lambda: False, parts.__setitem__, in_thread=False)
+        psd = np.concatenate(parts)
+    else:
+        psd = _multitaper_block(data, half_nbw, low_bias, freq_mask, adaptive, max_iter)
+    return psd / sf, freqs[freq_mask]
+
+
+def default_n_jobs(data):
+    """Use the process pool only when the work outweighs shipping the data to it."""
+    return pool_size() if data.size * 8 > 2 ** 22 and len(data) > 1 else 1
+
+
+def _multitaper_block(data, half_nbw, low_bias, freq_mask, adaptive, max_iter, max_bytes=50 * 2 ** 20):
+    n_times = data.shape[-1]
+    tapers, eigvals = dpss_tapers(n_times, half_nbw, low_bias)
+    adaptive = adaptive and len(eigvals) >= 3  # as in mne, too few tapers to weigh adaptively
+    n_freqs = n_times // 2 + 1
+    psd = np.empty((len(data), freq_mask.sum()))
+    # Tapered spectra of up to max_bytes at a time
+    n_chunk = max(max_bytes // (len(tapers) * n_freqs * 16), 1)
+    for start in range(0, len(data), n_chunk):
+        x = data[start:start + n_chunk]
+        x = x - x.mean(axis=-1, keepdims=True)
+        spectra = np.fft.rfft(x[:, np.newaxis, :] * tapers, axis=-1)
+        power = spectra.real ** 2 + spectra.imag ** 2  # channels x tapers x freqs
+        del spectra
+        # One-sided spectrum: the DC (and Nyquist) bin is not doubled by the weighting below
+        power[..., 0] /= 2.
+        if n_times % 2 == 0:
+            power[..., -1] /= 2.
+
+        if adaptive:
+            psd[start:start + n_chunk] = _adaptive_psd(power, eigvals, freq_mask, max_iter)
+        else:
+            psd[start:start + n_chunk] = _weighted_psd(power[..., freq_mask], eigvals[:, np.newaxis])
+    return psd
+
+
+def _weighted_psd(power, weights):
+    """Combine tapered power spectra with squared weights (tapers x freqs, or channels x tapers x freqs)."""
+    return 2 * (weights * power).sum(axis=-2) / weights.sum(axis=-2)
+
+
+def _adaptive_psd(power, eigvals, freq_mask, max_iter):
+    """Adaptive weighting (Percival & Walden) for every channel at once; a channel stops once it converges."""
+    # The variance of each signal, from the spectrum with fixed weights over all frequencies
+    fixed = _weighted_psd(power, eigvals[:, np.newaxis])
+    variance = np.trapz(fixed, dx=np.pi / power.shape[-1], axis=-1) / (2 * np.pi)
+    power = power[..., freq_mask]
+
+    eig = eigvals[:, np.newaxis]
+    psd = _weighted_psd(power[:, :2], eig[:2])  # start from the two best-concentrated tapers
+    active = np.arange(len(power))
+    error = np.zeros((len(power), len(eigvals), power.shape[-1]))
+    for _ in range(max_iter):
+        current = psd[active][:, np.newaxis]
+        weights = current / (eig * current + (1 - eig) * variance[active, np.newaxis, np.newaxis]) * np.sqrt(eig)
+        error[active] -= weights
+        converged = np.max(np.mean(error[active] ** 2, axis=1), axis=-1) < 1e-10
+        active, weights = active[~converged], weights[~converged]
+        if not len(active):
+            break
+        psd[active] = _weighted_psd(power[active], weights ** 2)
+        error[active] = weights
+    return psd
@@ -1,20 +1,27 @@
-import sys
 import numpy as np
 import pyqtgraph as pg
-from PyQt6 import QtWidgets, QtCore
-from mne.time_frequency import psd_array_multitaper
-from scipy.signal import decimate
+from PyQt6 import QtWidgets, QtGui, QtCore
 import pandas as pd
 
+from multitaper_psd_worker import MultitaperPSDWorker
+from spectral_engine import band_powers
+from worker_slot import WorkerSlot
+
 
 class MultitaperPSDPlot(QtWidgets.QWidget):
-    def __init__(self, band_d, downsample_factor=10):
+    def __init__(self, band_d):
         super().__init__()
         self.band_d = band_d
-        self.downsample_factor = downsample_factor
+        self.freqs = None
+        self.psd = None  # channels x freqs, as plotted
+        self.band_power = None  # channels x bands, absolute
+        self.relative_band_power = None  # channels x bands, relative to each channel's total
+        self.max_freq = 60  # Set maximum frequency to display
         self.base_colors = [(255, 0, 0, 100), (0, 255, 0, 100), (0, 0, 255, 100), (255, 255, 0, 100),
                             (0, 255, 255, 100)]
-        self.cache = {}
+        self.spectral_engine = None
+        self.request = None  # arguments of the last plot(), re-used when the estimator settings change
+        self.multitaper_job = WorkerSlot(on_finished=lambda: self.progressBar.setVisible(False))
         self.initUI()
 
     def initUI(self):
@@ -27,7 +34,29 @@ class MultitaperPSDPlot(QtWidgets.QWidget):
         self.plotWidget.getAxis('left').setTextPen('k')
         self.plotWidget.getAxis('bottom').setTextPen('k')
         self.plotWidget.showGrid(x=True, y=True, alpha=0.5)
-        main_layout.addWidget(self.plotWidget, 3)
+
+        left_layout = QtWidgets.QVBoxLayout()
+        left_layout.addWidget(self.plotWidget)
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setVisible(False)
+        left_layout.addWidget(self.progressBar)
+        self.cacheLabel = QtWidgets.QLabel()
+        left_layout.addWidget(self.cacheLabel)
+
+        options_layout = QtWidgets.QFormLayout()
+        self.bandwidth_input = QtWidgets.QLineEdit()
+        self.bandwidth_input.setValidator(QtGui.QDoubleValidator(0.0, 100.0, 3))
+        self.bandwidth_input.setPlaceholderText("default (8 frequency bins)")
+        options_layout.addRow('Bandwidth (Hz):', self.bandwidth_input)
+        self.adaptive_checkbox = QtWidgets.QCheckBox("Adaptive taper weights (slower)")
+        self.adaptive_checkbox.setChecked(True)
+        options_layout.addRow(self.adaptive_checkbox)
+        left_layout.addLayout(options_layout)
+
+        self.updateButton = QtWidgets.QPushButton('Update Multitaper PSD')
+        self.updateButton.clicked.connect(self.recompute)
+        left_layout.addWidget(self.updateButton)
+        main_layout.addLayout(left_layout, 3)
 
         right_layout = QtWidgets.QVBoxLayout()
 
@@ -50,32 +79,59 @@ class MultitaperPSDPlot(QtWidgets.QWidget):
         main_layout.addLayout(right_layout, 1)
         self.setLayout(main_layout)
 
-    def plot(self, data, sf):
+    def plot(self, spectral_engine, version, channels, reader, sf):
+        """Estimate the PSDs of channels on a worker thread, replacing any estimate still running."""
+        self.spectral_engine = spectral_engine
+        self.request = (version, list(channels), reader, sf)
+        self.recompute()
+
+    def recompute(self):
+        if self.request is None:
+            return
+        try:
+            bandwidth = float(self.bandwidth_input.text()) if self.bandwidth_input.text() else None
+        except ValueError:
+            QtWidgets.QMessageBox.warning(self, "Warning", "Invalid bandwidth.")
+            return
+
+        version, channels, reader, sf = self.request
+        worker = MultitaperPSDWorker(self.spectral_engine, version, channels, reader, sf, self.max_freq,
+                                     bandwidth=bandwidth, adaptive=self.adaptive_checkbox.isChecked())
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.multitaper_job.start(worker, [(worker.resultReady, self.handle_result),
+                                           (worker.estimateFailed, self.handle_failure),
+                                           (worker.progressChanged, self.update_progress)])
+
+    def cancel(self):
+        """Stop an estimate that is no longer wanted, e.g. after the selection changed."""
+        if self.multitaper_job.cancel():
+            self.progressBar.setVisible(False)
+
+    def update_progress(self, done, total):
+        self.progressBar.setMaximum(max(total, 1))
+        self.progressBar.setValue(done)
+
+    def handle_failure(self, message):
+        QtWidgets.QMessageBox.warning(self, "Multitaper PSD", message)
+
+    def handle_result(self, freqs, psd, cache_key):
+        stats = self.spectral_engine.stats()
+        self.cacheLabel.setText(f"Spectrum cache: {stats['hits']} hits, {stats['misses']} misses, "
+                                f"{stats['bytes'] / 2 ** 20:.1f} of {stats['max_bytes'] / 2 ** 20:.0f} MB")
+        self.update_plot(freqs, psd)
+
+    def update_plot(self, freqs, psd):
+        """Plot multitaper PSDs, as computed by the SpectralEngine from data downsampled to resolve max_freq."""
         self.plotWidget.clear()
         self.histogramWidget.clear()
 
-        max_freq = 60  # Set maximum frequency to display
-
-        # Downsample the data
-        data_ds = decimate(data, self.downsample_factor, axis=1)
-        sf_ds = sf / self.downsample_factor
-
-        cache_key = (tuple(data_ds.flatten()), sf_ds, max_freq)
-        if cache_key in self.cache:
-            freqs, psd = self.cache[cache_key]
-        else:
-            if data_ds.ndim == 2:  # Handle multi-channel data
-                psd_all = []
-                for channel in data_ds:
-                    psd, freqs = psd_array_multitaper(channel, sfreq=sf_ds, fmax=max_freq, adaptive=True, low_bias=True,
-                                                      normalization='full', verbose=0)
-                    psd_all.append(psd)
-                psd = np.mean(psd_all, axis=0)
-            else:  # Handle single-channel data
-                psd, freqs = psd_array_multitaper(data_ds, sfreq=sf_ds, fmax=max_freq, adaptive=True, low_bias=True,
-                                                  normalization='full', verbose=0)
-
-            self.cache[cache_key] = (freqs, psd)
+        freqs, psd = np.asarray(freqs), np.atleast_2d(psd)  # per-channel spectra
+
+        self.freqs = freqs
+        self.psd = psd
+        self.band_power, self.relative_band_power = band_powers(freqs, psd, self.band_d)
+        psd = psd.mean(axis=0)
 
         self.plotWidget.plot(freqs, psd, pen='r')
 
@@ -94,13 +150,8 @@ class MultitaperPSDPlot(QtWidgets.QWidget):
         return colors[:num_bands]
 
     def calculate_relative_power(self, freqs, psd, colors):
-        total_power = np.trapz(psd, freqs)
-        relative_powers = {}
-
-        for band, (low, high) in self.band_d.items():
-            mask = (freqs >= low) & (freqs < high)
-            band_power = np.trapz(psd[mask], freqs[mask])
-            relative_powers[band] = band_power / total_power
+        _, relative = band_powers(freqs, psd, self.band_d)  # of the averaged spectrum
+        relative_powers = dict(zip(self.band_d, relative[0]))
 
         self.update_table(relative_powers)
         self.plot_histogram(relative_powers, colors)
@@ -1,27 +1,39 @@
 import numpy as np
 from PyQt6 import QtCore
-from mne.time_frequency import psd_array_multitaper
+
+from process_pool import pool_size
 
 
 class MultitaperPSDWorker(QtCore.QThread):
-    resultReady = QtCore.pyqtSignal(np.ndarray, np.ndarray,tuple)
+    resultReady = QtCore.pyqtSignal(np.ndarray, np.ndarray, tuple)
+    progressChanged = QtCore.pyqtSignal(int, int)  # channels done, total channels
+    estimateFailed = QtCore.pyqtSignal(str)
 
-    def __init__(self, data, sf, max_freq, band_d, cache_key):
+    def __init__(self, spectral_engine, version, channels, reader, sf, max_freq, bandwidth=None, adaptive=True,
+                 block_size=None):
         super().__init__()
-        self.data = data
+        self.spectral_engine = spectral_engine
+        self.version = version
+        self.channels = channels
+        self.reader = reader
         self.sf = sf
         self.max_freq = max_freq
-        self.band_d = band_d
-        self.cache_key = cache_key
+        self.bandwidth = bandwidth
+        self.adaptive = adaptive
+        # Channels per step: enough to keep the process pool busy, few enough to notice an interruption
+        self.block_size = block_size or max(2 * pool_size(), 4)
+        self.cache_key = (version, tuple(channels))
 
     def run(self):
-        if self.data.ndim == 2:  # Handle multi-channel data
-            psd_all = []
-            for channel in self.data:
-                psd, freqs = psd_array_multitaper(channel, sfreq=self.sf, fmax=self.max_freq, adaptive=True, low_bias=True, normalization='full', verbose=0)
-                psd_all.append(psd)
-            psd = np.mean(psd_all, axis=0)
-        else:  # Handle single-channel data
-            psd, freqs = psd_array_multitaper(self.data, sfreq=self.sf, fmax=self.max_freq, adaptive=True, low_bias=True, normalization='full', verbose=0)
-
-        self.resultReady.emit(freqs, psd, self.cache_key)
+        try:
+            result = self.spectral_engine.multitaper(self.version, self.channels, self.reader, self.sf,
+                                                     fmax=self.max_freq, bandwidth=self.bandwidth,
+                                                     adaptive=self.adaptive, block_size=self.block_size,
+                                                     progress_callback=self.progressChanged.emit,
+                                                     is_cancelled=self.isInterruptionRequested)
+        except ValueError as e:
+            self.estimateFailed.emit(str(e))
+            return
+        if result is not None:
+            freqs, psd = result
+            self.resultReady.emit(freqs, psd, self.cache_key)
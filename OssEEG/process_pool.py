@@ -0,0 +1,68 @@
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+_pool_lock = threading.Lock()  # the pool is first asked for from several worker threads
+
+
+def get_process_pool():
+    """Shared pool of worker processes for CPU-bound analyses, created on first use.
+
+    Workers are spawned rather than forked: the GUI process runs Qt and worker threads, which must not
+    be duplicated into a child. Functions sent to the pool should live in modules that import quickly.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def pool_size():
+    return os.cpu_count() or 1
+
+
+def run_tasks(tasks, is_cancelled, on_result, in_thread=None, poll_interval=.1):
+    """Run (function, args) tasks on the shared pool, calling on_result(index, result) as each one finishes.
+
+    is_cancelled() is polled every poll_interval seconds, so a cancellation is noticed while a long task is
+    still running; the tasks that have not started are then dropped and False is returned. With in_thread
+    (the default on a single core) the tasks run one after the other in the calling thread instead, checking
+    is_cancelled() before each. Returns True once every task has finished.
+    """
+    if in_thread is None:
+        in_thread = pool_size() == 1
+    if in_thread:
+        for idx, (function, args) in enumerate(tasks):
+            if is_cancelled():
+                return False
+            on_result(idx, function(*args))
+        return True
+
+    pool = get_process_pool()
+    futures = {pool.submit(function, *args): idx for idx, (function, args) in enumerate(tasks)}
+    pending = set(futures)
+    while pending:
+        if is_cancelled():
+            for future in pending:
+                future.cancel()
+            return False
+        finished, pending = concurrent.futures.wait(pending, timeout=poll_interval,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in finished:
+            on_result(futures[future], future.result())
+    return True
+
+
+@atexit.register
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -39,9 +39,9 @@ class ReportSelectionDialog(QDialog):
         include_complexity, include_specparam, include_ica, include_kurtosis = self.getSelections()
 
         report_content = "<html><head><title>EEG Analysis Report</title></head><body>"
-        if include_complexity:
-            complexity_text = self.eeg_analyzer.complexity_calculator.complexityWidget.toPlainText()
-            report_content += "<h2>Complexity Measures:</h2><pre>" + complexity_text + "</pre><br>"
+        complexity_results = self.eeg_analyzer.complexity_calculator.results
+        if include_complexity and complexity_results is not None:
+            report_content += "<h2>Complexity Measures:</h2>" + complexity_results.to_html() + "<br>"
 
         if include_specparam:
             specparam_report = self.eeg_analyzer.graph_manager.specparamAnalysisPlot.generate_specparam_report()
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import signal
+
+
+def decimation_factor(sf, max_freq, margin=2.5):
+    """Largest integer factor that keeps max_freq inside the pass band of the anti-aliasing filter.
+
+    The new rate stays at least margin * max_freq, i.e. the new Nyquist frequency keeps a 25% guard band
+    above max_freq for the filter's transition.
+    """
+    if max_freq is None or not np.isfinite(max_freq) or max_freq <= 0:
+        return 1
+    return max(int(sf // (margin * max_freq)), 1)
+
+
+class Resampler:
+    """Anti-aliased, decimated copies of channels, shared by every analysis that needs a lower rate.
+
+    All missing channels are decimated in one polyphase call and kept per (data version, factor, channel)
+    in an LRU bounded by max_bytes, so e.g. the multitaper view and the complexity measures read the
+    same downsampled signal. Channels are read in blocks of about read_bytes of full-rate data, so a lazily
+    opened recording is never read whole. Safe to call from worker threads.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, read_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.read_bytes = read_bytes
+        self.channels = OrderedDict()  # (version, factor, channel) -> decimated samples
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+
+    def decimate(self, version, channels, reader, sf, max_freq):
+        """Return (channels x samples data, new sf) at the lowest rate that still resolves max_freq.
+
+        reader(channels) returns the full-rate (channels x samples) data of the requested channels.
+        """
+        return self.decimate_by(version, channels, reader, sf, decimation_factor(sf, max_freq))
+
+    def decimate_by(self, version, channels, reader, sf, factor):
+        """Return (channels x samples data, new sf) decimated by an integer factor."""
+        channels = list(channels)
+        if factor == 1:
+            return reader(channels), sf
+
+        with self.lock:
+            cached = {channel: self.channels.get((version, factor, channel)) for channel in channels}
+        missing = [channel for channel in channels if cached[channel] is None]
+        first, block_size = 0, 1  # the first channel tells how many fit in read_bytes
+        while first < len(missing):
+            block = missing[first:first + block_size]
+            data = reader(block)
+            decimated = signal.resample_poly(data, 1, factor, axis=-1).astype(data.dtype, copy=False)
+            with self.lock:
+                for channel, values in zip(block, decimated):
+                    cached[channel] = values.copy()  # don't let one channel keep the whole block alive
+                    self._store((version, factor, channel), cached[channel])
+            first += len(block)
+            block_size = max(self.read_bytes // max(data[0].nbytes, 1), 1)
+
+        with self.lock:
+            for channel in channels:
+                if (version, factor, channel) in self.channels:
+                    self.channels.move_to_end((version, factor, channel))
+        return np.array([cached[channel] for channel in channels]), sf / factor
+
+    def _store(self, key, values):
+        if key in self.channels:
+            return
+        self.channels[key] = values
+        self.n_bytes += values.nbytes
+        while self.n_bytes > self.max_bytes and len(self.channels) > 1:
+            _, evicted = self.channels.popitem(last=False)
+            self.n_bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.channels.clear()
+            self.n_bytes = 0
@@ -1,10 +1,14 @@
 import gc
-import hashlib
+import itertools
+from collections import OrderedDict
 
+import numpy as np
 import pyqtgraph as pg
 from PyQt6 import QtWidgets, QtGui, QtCore
 
+from specparam_sweep_worker import SpecparamSweepWorker
 from specparam_worker import SpecparamWorker
+from worker_slot import WorkerSlot
 
 
 class SpecparamAnalysisPlot(QtWidgets.QWidget):
@@ -28,9 +32,16 @@ class SpecparamAnalysisPlot(QtWidgets.QWidget):
         self.plotWidget = None
         self.psd_plot = None
         self.initUI()
-        self.specparam_worker = None
-        self.cache = {}
+        self.fit_job = WorkerSlot(on_finished=self.on_fit_finished)
+        self.sweep_job = WorkerSlot(on_finished=self.hide_loading)
+        self.sweep_request = None  # (channel indices, sf) the sweep table was computed for
+        # (data version, channels, sf, parameters) -> SpecparamStore; the PSDs themselves are cached by the
+        # SpectralEngine, so neither a new setting nor a sweep recomputes them
+        self.cache = OrderedDict()
+        self.max_cache_entries = 64
+        self.max_sweep_settings = 48
         self.selected_channels = []
+        self.specparam_store = None  # per-channel fits of the setting on display
         self.sm = None  # Store the SpectralModel
 
     def initUI(self):
@@ -91,6 +102,34 @@ class SpecparamAnalysisPlot(QtWidgets.QWidget):
         self.calculateButton.clicked.connect(self.on_calculate_button_clicked)
         layout.addWidget(self.calculateButton)
 
+        # Parameter sweep: every combination of the listed values, an empty list keeps the value above
+        sweepGroup = QtWidgets.QGroupBox('Parameter Sweep')
+        sweep_layout = QtWidgets.QFormLayout()
+        self.sweep_inputs = {}
+        for name, label, values in (('min_width', 'Min Peak Widths:', ''), ('max_width', 'Max Peak Widths:', ''),
+                                    ('max_n_peaks', 'Numbers of Peaks:', '2, 4, 6, 8'),
+                                    ('min_peak_height', 'Min Peak Heights:', '0.05, 0.1, 0.2, 0.4')):
+            self.sweep_inputs[name] = QtWidgets.QLineEdit(values)
+            self.sweep_inputs[name].setPlaceholderText('comma-separated values')
+            sweep_layout.addRow(label, self.sweep_inputs[name])
+
+        self.sweepButton = QtWidgets.QPushButton('Sweep Parameters')
+        self.sweepButton.clicked.connect(self.on_sweep_button_clicked)
+        sweep_layout.addRow(self.sweepButton)
+
+        # Goodness of fit per setting; selecting a row shows that fit
+        self.sweepTable = QtWidgets.QTableWidget(0, 7)
+        self.sweepTable.setHorizontalHeaderLabels(['Min Width', 'Max Width', 'Max Peaks', 'Min Height',
+                                                   'Mean R²', 'Mean Error', 'Failed'])
+        self.sweepTable.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.sweepTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectionBehavior.SelectRows)
+        self.sweepTable.setSelectionMode(QtWidgets.QAbstractItemView.SelectionMode.SingleSelection)
+        self.sweepTable.itemSelectionChanged.connect(self.on_sweep_row_selected)
+        self.sweepTable.setVisible(False)
+        sweep_layout.addRow(self.sweepTable)
+        sweepGroup.setLayout(sweep_layout)
+        layout.addWidget(sweepGroup)
+
         # Add "Calculating..." label and loading animation
         self.loadingLabel = QtWidgets.QLabel("Calculating...")
         self.loadingLabel.setAlignment(QtCore.Qt.AlignmentFlag.AlignCenter)
@@ -131,74 +170,105 @@ class SpecparamAnalysisPlot(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "Warning", "No channels selected.")
             return
 
-        data = self.get_data_for_selected_channels(selected_channels)
+        channel_indices = self.get_selected_channel_indices(selected_channels)
         sf = self.get_sampling_frequency()
 
-        self.plot(data, sf)
+        self.plot(channel_indices, sf)
+
+    def current_settings(self):
+        """User-defined FOOOF parameters: (min_width, max_width, max_n_peaks, min_peak_height)."""
+        return (int(self.min_width_input.text()), int(self.max_width_input.text()),
+                int(self.max_n_peaks_input.text()), float(self.min_peak_height_input.text()))
+
+    def cache_key(self, channel_indices, sf, setting):
+        # The data version identifies the samples, so the key never has to look at the signal itself
+        return (self.eeg_analyzer.data_version, tuple(channel_indices), sf) + tuple(setting)
+
+    def spectrum(self, channel_indices, sf):
+        """Callable for the workers: Welch PSDs of the channels, computed once by the SpectralEngine."""
+        version = self.eeg_analyzer.data_version
+        return lambda: self.eeg_analyzer.spectral_engine.welch(version, channel_indices, self.eeg_analyzer.get_data, sf)
 
-    def plot(self, data, sf):
+    def plot(self, channel_indices, sf):
         print("Starting plot")
         self.psd_plot.clear()
         self.specparam_plot.clear()
 
-        # Get user-defined FOOOF parameters
-        min_width = int(self.min_width_input.text())
-        max_width = int(self.max_width_input.text())
-        max_n_peaks = int(self.max_n_peaks_input.text())
-        min_peak_height = float(self.min_peak_height_input.text())
+        min_width, max_width, max_n_peaks, min_peak_height = self.current_settings()
 
         print(f"Using parameters: min_width={min_width}, max_width={max_width}, max_n_peaks={max_n_peaks}, "
               f"min_peak_height={min_peak_height}")
 
-        # Create a unique hash for the data and parameters to use as a cache key
-        data_hash = hashlib.md5(data.tobytes()).hexdigest()
-        cache_key = (data.shape, data_hash, sf, min_width, max_width, max_n_peaks, min_peak_height)
+        cache_key = self.cache_key(channel_indices, sf, (min_width, max_width, max_n_peaks, min_peak_height))
 
         print(f"Plotting with cache_key: {cache_key}")
 
+        self.cancel_fit()  # a new request supersedes the running one
         if cache_key in self.cache:
             print("Using cached data")
-            freqs, modeled_spectrum, aperiodic_fit, periodic_fit = self.cache[cache_key]
-            self.update_plot(freqs, modeled_spectrum, aperiodic_fit, periodic_fit)
+            self.cache.move_to_end(cache_key)
+            self.specparam_store = self.cache[cache_key]
+            self.update_plot(*self.specparam_store.curves())
+            # The report model of the first channel, rebuilt from its record and PSD without touching the spectrum
+            self.sm = self.specparam_store.first_model()
         else:
             print("Starting SpecparamWorker")
-            self.specparam_worker = SpecparamWorker(data, sf, min_width, max_width, max_n_peaks, min_peak_height)
-            self.specparam_worker.specparamFinished.connect(self.update_plot_and_cache)
-            self.specparam_worker.finished.connect(self.on_worker_finished)
-            self.specparam_worker.start()
-
-            # Show the loading message and animation
-            self.loadingLabel.setVisible(True)
-            self.loadingIcon.setVisible(True)
-            self.overlayWidget.setVisible(True)
-            self.movie.start()
-
-    def on_worker_finished(self):
+            worker = SpecparamWorker(self.spectrum(channel_indices, sf), channel_indices, min_width, max_width,
+                                     max_n_peaks, min_peak_height, cache_key)
+            self.fit_job.start(worker, [(worker.specparamFinished, self.update_plot_and_cache),
+                                        (worker.progressChanged, self.update_progress)])
+
+            self.show_loading("Calculating...")
+
+    def show_loading(self, text):
+        # Show the loading message and animation
+        self.loadingLabel.setText(text)
+        self.loadingLabel.setVisible(True)
+        self.loadingIcon.setVisible(True)
+        self.overlayWidget.setVisible(True)
+        self.movie.start()
+
+    def hide_loading(self):
+        # Hide the loading message and animation, unless a fit or sweep is still running
+        if self.fit_job.worker is not None or self.sweep_job.worker is not None:
+            return
+        self.loadingLabel.setVisible(False)
+        self.loadingIcon.setVisible(False)
+        self.overlayWidget.setVisible(False)
+        self.movie.stop()
+
+    def update_progress(self, done, total):
+        self.loadingLabel.setText(f"Calculating... {done}/{total} channels")
+
+    def cancel_fit(self):
+        """Stop a fit that is no longer wanted; it stops between channels and its result is ignored."""
+        if self.fit_job.cancel():
+            print("Cancelled SpecparamWorker")
+            self.hide_loading()
+
+    def cancel_sweep(self):
+        if self.sweep_job.cancel():
+            print("Cancelled SpecparamSweepWorker")
+            self.hide_loading()
+
+    def on_fit_finished(self):
         print("SpecparamWorker finished")
-        self.specparam_worker.deleteLater()  # Ensure the worker is properly cleaned up
-        self.specparam_worker = None
+        self.hide_loading()
         gc.collect()  # Manually trigger garbage collection to clean up any residual objects
 
     def update_plot_and_cache(self, freqs, modeled_spectrum, aperiodic_fit, periodic_fit):
         print("Updating plot and cache")
-        data = self.specparam_worker.data
-        sf = self.specparam_worker.sf
-
-        # Get user-defined FOOOF parameters
-        min_width = int(self.min_width_input.text())
-        max_width = int(self.max_width_input.text())
-        max_n_peaks = int(self.max_n_peaks_input.text())
-        min_peak_height = float(self.min_peak_height_input.text())
-
-        # Create a unique hash for the data and parameters to use as a cache key
-        data_hash = hashlib.md5(data.tobytes()).hexdigest()
-        cache_key = (data.shape, data_hash, sf, min_width, max_width, max_n_peaks, min_peak_height)
+        worker = self.sender()
+        cache_key = worker.cache_key  # the key of the request the worker was started for
 
         print(f"Caching data with cache_key: {cache_key}")
 
-        self.cache[cache_key] = (freqs, modeled_spectrum, aperiodic_fit, periodic_fit)
+        self.cache_fit(cache_key, worker.store)
+        if worker is not self.fit_job.worker:
+            return  # a result queued before its worker was superseded; cached, but not what is asked for now
+        self.specparam_store = worker.store
         self.update_plot(freqs, modeled_spectrum, aperiodic_fit, periodic_fit)
-        self.sm = self.specparam_worker.sm  # Store the SpectralModel
+        self.sm = worker.sm  # Store the SpectralModel
 
     def update_plot(self, freqs, modeled_spectrum, aperiodic_fit, periodic_fit):
         print("Updating plot")
@@ -210,22 +280,102 @@ class SpecparamAnalysisPlot(QtWidgets.QWidget):
         self.specparam_plot.addItem(self.specparam_curve)
         self.specparam_plot.addItem(self.aperiodic_curve)
 
-        # Hide the loading message and animation
-        self.loadingLabel.setVisible(False)
-        self.loadingIcon.setVisible(False)
-        self.overlayWidget.setVisible(False)
-        self.movie.stop()
+        self.hide_loading()
+
+    def cache_fit(self, cache_key, store):
+        self.cache[cache_key] = store
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.max_cache_entries:
+            self.cache.popitem(last=False)
+
+    def sweep_grid(self):
+        """Every combination of the sweep values; a parameter without values keeps its current setting."""
+        values = []
+        for input_field, value, cast in zip(self.sweep_inputs.values(), self.current_settings(), (int, int, int, float)):
+            text = input_field.text().replace(';', ',')
+            values.append(sorted({cast(v) for v in text.split(',') if v.strip()}) or [value])
+        return [setting for setting in itertools.product(*values) if setting[0] < setting[1]]
+
+    def on_sweep_button_clicked(self):
+        if not self.selected_channels:
+            QtWidgets.QMessageBox.warning(self, "Warning", "No channels selected.")
+            return
+        try:
+            grid = self.sweep_grid()
+        except ValueError:
+            QtWidgets.QMessageBox.warning(self, "Warning", "Invalid sweep values.")
+            return
+        if not grid or len(grid) > self.max_sweep_settings:
+            QtWidgets.QMessageBox.warning(self, "Warning", f"The sweep must have between 1 and "
+                                                           f"{self.max_sweep_settings} settings, not {len(grid)}.")
+            return
+
+        channel_indices = self.get_selected_channel_indices(self.selected_channels)
+        sf = self.get_sampling_frequency()
+        print(f"Sweeping {len(grid)} Specparam settings")
+        worker = SpecparamSweepWorker(self.spectrum(channel_indices, sf), channel_indices, grid,
+                                      self.cache_key(channel_indices, sf, ()))
+        # a new sweep supersedes the running one
+        self.sweep_job.start(worker, [(worker.progressChanged, self.update_sweep_progress),
+                                      (worker.sweepFinished, self.show_sweep)])
+        self.show_loading("Sweeping...")
+
+    def update_sweep_progress(self, done, total):
+        self.loadingLabel.setText(f"Sweeping... {done}/{total} fits")
+
+    def show_sweep(self, stores):
+        """Cache the fits of every setting and list its goodness of fit, best (lowest error) first."""
+        worker = self.sender()
+        key_prefix = worker.cache_key  # (data version, channels, sf) when the sweep was requested
+        for setting, store in stores:
+            self.cache_fit(key_prefix + tuple(setting), store)
+        if worker is not self.sweep_job.worker:
+            return  # queued before the sweep was superseded
+        self.sweep_request = (list(key_prefix[1]), key_prefix[2])
+        rows = []
+        for setting, store in stores:
+            error, r_squared = store.values('error'), store.values('r_squared')
+            failed = int(np.isnan(error).sum())
+            fitted = failed < len(store)
+            rows.append(setting + (np.nanmean(r_squared) if fitted else np.nan,
+                                   np.nanmean(error) if fitted else np.nan, failed))
+        rows.sort(key=lambda row: (np.isnan(row[5]), row[5]))
+
+        self.sweepTable.blockSignals(True)
+        self.sweepTable.setRowCount(len(rows))
+        for row_idx, row in enumerate(rows):
+            for col, value in enumerate(row):
+                item = QtWidgets.QTableWidgetItem(f"{value:.4f}" if col in (4, 5) else f"{value:g}")
+                item.setData(QtCore.Qt.ItemDataRole.UserRole, value)
+                self.sweepTable.setItem(row_idx, col, item)
+        self.sweepTable.blockSignals(False)
+        self.sweepTable.setVisible(True)
+
+    def on_sweep_row_selected(self):
+        """Take over the selected setting and show its (cached) fit."""
+        rows = self.sweepTable.selectionModel().selectedRows()
+        if not rows:
+            return
+        value = lambda col: self.sweepTable.item(rows[0].row(), col).data(QtCore.Qt.ItemDataRole.UserRole)
+        self.min_width_input.setText(str(value(0)))
+        self.max_width_input.setText(str(value(1)))
+        self.max_n_peaks_input.setText(str(value(2)))
+        self.min_peak_height_input.setText(str(value(3)))
+        self.plot(*self.sweep_request)
 
     def set_selected_channels(self, selected_channels):
         print(f"Selected channels updated: {selected_channels}")
+        if selected_channels != self.selected_channels:
+            # Fits of the previous selection would no longer be shown; free the cores for the next request
+            self.cancel_fit()
+            self.cancel_sweep()
         self.selected_channels = selected_channels
 
-    def get_data_for_selected_channels(self, selected_channels):
-        print(f"Getting data for selected channels: {selected_channels}")
+    def get_selected_channel_indices(self, selected_channels):
+        print(f"Getting indices of selected channels: {selected_channels}")
         if not self.eeg_analyzer.channel_names:
             raise ValueError("channel_names is not set")
-        channel_indices = [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
-        return self.eeg_analyzer.data[channel_indices, :]
+        return [self.eeg_analyzer.channel_names.index(ch) for ch in selected_channels]
 
     def get_sampling_frequency(self):
         print("Getting sampling frequency")
@@ -254,8 +404,10 @@ class SpecparamAnalysisPlot(QtWidgets.QWidget):
             # Reset stdout
             sys.stdout = old_stdout
 
-            # Get the report content
+            # Get the report content, followed by the fit of every channel
             report = mystdout.getvalue()
+            if self.specparam_store is not None:
+                report += "\nPer-channel results:\n" + self.specparam_store.to_text(self.eeg_analyzer.channel_names)
             return report
         else:
             return "No Specparam model available.\n"
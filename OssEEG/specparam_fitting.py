@@ -0,0 +1,76 @@
+import numpy as np
+
+
+def prepare_spectrum(freqs, psds):
+    """Drop the DC bin, which a power law cannot fit; the fit itself is always done in double precision."""
+    if freqs[0] == 0:
+        freqs = freqs[1:]
+        psds = psds[:, 1:]
+    return np.asarray(freqs, dtype=np.float64), np.asarray(psds, dtype=np.float64)
+
+
+def fit_channels(freqs, psds, settings):
+    """Fit one SpectralModel per row of psds and return the fits as compact arrays instead of model objects.
+
+    settings are the SpectralModel arguments. The result maps 'aperiodic' (channels x offset, exponent),
+    'peaks' (channels x max_n_peaks x CF, PW, BW), 'gaussians' (channels x max_n_peaks x mean, height, std),
+    'r_squared' and 'error' to arrays; peaks that were not found and failed fits are NaN. Runs in the
+    process pool, so it imports specparam itself.
+    """
+    from specparam import SpectralModel
+
+    n_channels, max_n_peaks = len(psds), settings['max_n_peaks']
+    results = {'aperiodic': np.full((n_channels, 2), np.nan),
+               'peaks': np.full((n_channels, max_n_peaks, 3), np.nan),
+               'gaussians': np.full((n_channels, max_n_peaks, 3), np.nan),
+               'r_squared': np.full(n_channels, np.nan),
+               'error': np.full(n_channels, np.nan)}
+    for idx, psd in enumerate(psds):
+        model = SpectralModel(verbose=False, **settings)
+        model.fit(freqs, psd)
+        if not model.has_model:
+            continue
+        results['aperiodic'][idx] = model.aperiodic_params_
+        results['peaks'][idx, :len(model.peak_params_)] = model.peak_params_
+        results['gaussians'][idx, :len(model.gaussian_params_)] = model.gaussian_params_
+        results['r_squared'][idx] = model.r_squared_
+        results['error'][idx] = model.error_
+    return results
+
+
+def concatenate_results(parts):
+    """Join the results of consecutive blocks of channels."""
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def model_curves(freqs, aperiodic, gaussians):
+    """(modeled spectrum, aperiodic fit) of every channel in log10 power, regenerated from its parameters."""
+    aperiodic_fit = aperiodic[:, :1] - np.log10(freqs ** aperiodic[:, 1:])
+    mean, height, std = np.moveaxis(gaussians, -1, 0)[..., np.newaxis]  # channels x peaks x 1 each
+    peaks = np.nansum(height * np.exp(-(freqs - mean) ** 2 / (2 * std ** 2)), axis=1)
+    return aperiodic_fit + peaks, aperiodic_fit
+
+
+def average_curves(freqs, results):
+    """(modeled spectrum, aperiodic fit, periodic fit) averaged over the channels whose fit succeeded."""
+    modeled_spectrum, aperiodic_fit = model_curves(freqs, results['aperiodic'], results['gaussians'])
+    periodic_fit = modeled_spectrum - aperiodic_fit  # Extract periodic component
+    return (np.nanmean(modeled_spectrum, axis=0), np.nanmean(aperiodic_fit, axis=0),
+            np.nanmean(periodic_fit, axis=0))
+
+
+def build_model(freqs, psd, settings, results, idx):
+    """A SpectralModel for channel idx, rebuilt from its compact results (for reports), without refitting."""
+    from specparam import SpectralModel
+    from specparam.data import FitResults
+
+    found = ~np.isnan(results['peaks'][idx, :, 0])
+    model = SpectralModel(verbose=False, **settings)
+    model.add_data(freqs, psd)
+    model.add_results(FitResults(aperiodic_params=results['aperiodic'][idx],
+                                 peak_params=results['peaks'][idx][found],
+                                 r_squared=results['r_squared'][idx],
+                                 error=results['error'][idx],
+                                 gaussian_params=results['gaussians'][idx][found]))
+    model._regenerate_model()  # as SpectralModel.load does, so the fitted curves are there to report
+    return model
@@ -0,0 +1,86 @@
+import numpy as np
+
+from specparam_fitting import average_curves, build_model
+
+
+class SpecparamStore:
+    """Per-channel Specparam fits of one setting, kept as a single structured array.
+
+    One record per channel holds its index, the aperiodic offset and exponent, r_squared, error, the
+    number of peaks and the peak and gaussian parameters (padded with NaN up to max_n_peaks). Queried per
+    channel for reports, or per field across channels, e.g. the exponents for a topographic display.
+    The PSD of the first channel is kept too, so that its report model can be rebuilt without the spectrum.
+    """
+
+    def __init__(self, channels, freqs, settings, results, first_psd):
+        self.freqs = freqs
+        self.settings = settings
+        self.first_psd = first_psd  # a copy, so the store does not keep the PSDs of every channel alive
+        max_n_peaks = results['peaks'].shape[1]
+        self.records = np.zeros(len(channels), dtype=[('channel', np.int32), ('offset', np.float64),
+                                                      ('exponent', np.float64), ('r_squared', np.float64),
+                                                      ('error', np.float64), ('n_peaks', np.int16),
+                                                      ('peaks', np.float64, (max_n_peaks, 3)),
+                                                      ('gaussians', np.float64, (max_n_peaks, 3))])
+        self.records['channel'] = channels
+        self.records['offset'], self.records['exponent'] = results['aperiodic'].T
+        self.records['r_squared'] = results['r_squared']
+        self.records['error'] = results['error']
+        self.records['n_peaks'] = (~np.isnan(results['peaks'][..., 0])).sum(axis=1)
+        self.records['peaks'] = results['peaks']
+        self.records['gaussians'] = results['gaussians']
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def channels(self):
+        return self.records['channel']
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes + self.freqs.nbytes + self.first_psd.nbytes
+
+    def channel(self, channel):
+        """The record of a channel index."""
+        idx = np.flatnonzero(self.records['channel'] == channel)
+        if not len(idx):
+            raise KeyError(f"channel {channel} was not fitted")
+        return self.records[idx[0]]
+
+    def peaks(self, channel):
+        """(CF, PW, BW) of the peaks found in a channel."""
+        record = self.channel(channel)
+        return record['peaks'][:record['n_peaks']]
+
+    def values(self, field):
+        """One value per channel, in the order of channels, e.g. values('exponent')."""
+        return self.records[field]
+
+    def results(self):
+        """The fits in the layout of specparam_fitting.fit_channels."""
+        return {'aperiodic': np.column_stack([self.records['offset'], self.records['exponent']]),
+                'peaks': self.records['peaks'], 'gaussians': self.records['gaussians'],
+                'r_squared': self.records['r_squared'], 'error': self.records['error']}
+
+    def curves(self):
+        """(freqs, modeled spectrum, aperiodic fit, periodic fit) averaged over the fitted channels."""
+        return (self.freqs,) + average_curves(self.freqs, self.results())
+
+    def model(self, channel, psd):
+        """A SpectralModel of one channel, rebuilt from its record and its PSD (at freqs) without refitting."""
+        idx = int(np.flatnonzero(self.records['channel'] == channel)[0])
+        return build_model(self.freqs, psd, self.settings, self.results(), idx)
+
+    def first_model(self):
+        """The SpectralModel of the first channel, for reports."""
+        return self.model(int(self.records['channel'][0]), self.first_psd)
+
+    def to_text(self, channel_names):
+        """Per-channel table of the fits, for reports."""
+        lines = [f"{'Channel':<10}{'Offset':>10}{'Exponent':>10}{'R²':>10}{'Error':>10}  Peaks (CF, PW, BW)"]
+        for record in self.records:
+            peaks = ", ".join(f"({cf:.1f}, {pw:.2f}, {bw:.1f})" for cf, pw, bw in record['peaks'][:record['n_peaks']])
+            lines.append(f"{channel_names[record['channel']]:<10}{record['offset']:>10.3f}{record['exponent']:>10.3f}"
+                         f"{record['r_squared']:>10.3f}{record['error']:>10.3f}  {peaks}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,62 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from process_pool import pool_size, run_tasks
+from specparam_fitting import concatenate_results, fit_channels, prepare_spectrum
+from specparam_store import SpecparamStore
+
+
+class SpecparamSweepWorker(QThread):
+    """Fit a grid of Specparam settings against one set of PSDs and report the goodness of fit of each."""
+    sweepFinished = pyqtSignal(list)  # [(setting, SpecparamStore)] in the order of the grid
+    progressChanged = pyqtSignal(int, int)  # fits done, total fits
+
+    def __init__(self, spectrum, channels, settings_grid, cache_key=None):
+        super().__init__()
+        self.spectrum = spectrum  # () -> (freqs, channels x freqs) Welch PSDs, e.g. from the SpectralEngine
+        self.channels = tuple(channels)  # channel indices of the rows of the spectrum
+        self.settings_grid = tuple(settings_grid)  # ((min_width, max_width, max_n_peaks, min_peak_height), ...)
+        self.cache_key = cache_key  # (data version, channels, sf) at the time of the request
+
+    def run(self):
+        print("SpecparamSweepWorker started")
+        # The PSDs are computed (or fetched) once and shared by every setting
+        freqs, psds = prepare_spectrum(*self.spectrum())
+        n_channels, n_fits = len(psds), len(psds) * len(self.settings_grid)
+
+        tasks = [(setting, start, psds[start:start + self.batch_size(n_channels)])
+                 for setting in self.settings_grid
+                 for start in range(0, n_channels, self.batch_size(n_channels))]
+        parts, done = {}, 0
+
+        def on_result(idx, part):
+            nonlocal done
+            setting, start, _ = tasks[idx]
+            parts[setting, start] = part
+            done += len(part['error'])
+            self.progressChanged.emit(done, n_fits)
+
+        if not run_tasks([(fit_channels, (freqs, block, self.model_settings(setting))) for setting, _, block in tasks],
+                         self.isInterruptionRequested, on_result):
+            print("SpecparamSweepWorker cancelled")
+            return
+
+        first_psd = psds[0].copy()
+        stores = [(setting, SpecparamStore(self.channels, freqs, self.model_settings(setting),
+                                           concatenate_results([parts[key] for key in sorted(parts)
+                                                                if key[0] == setting]), first_psd))
+                  for setting in self.settings_grid]
+        print("SpecparamSweepWorker finished processing")
+        self.sweepFinished.emit(stores)
+
+    def batch_size(self, n_channels):
+        # A few tasks per core over the whole grid, single channels without a pool so that an interruption
+        # is noticed between channels; a batch never spans two settings
+        if pool_size() == 1:
+            return 1
+        return min(max(n_channels * len(self.settings_grid) // (4 * pool_size()), 1), n_channels)
+
+    @staticmethod
+    def model_settings(setting):
+        min_width, max_width, max_n_peaks, min_peak_height = setting
+        return {'peak_width_limits': (min_width, max_width), 'max_n_peaks': max_n_peaks,
+                'min_peak_height': min_peak_height}
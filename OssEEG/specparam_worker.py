@@ -1,59 +1,64 @@
 import numpy as np
 from PyQt6.QtCore import QThread, pyqtSignal
-from specparam import SpectralModel
-from scipy import signal
-import concurrent.futures
+
+from process_pool import pool_size, run_tasks
+from specparam_fitting import concatenate_results, fit_channels, prepare_spectrum
+from specparam_store import SpecparamStore
 
 class SpecparamWorker(QThread):
     specparamFinished = pyqtSignal(np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+    progressChanged = pyqtSignal(int, int)  # channels fitted, total channels
 
-    def __init__(self, data, sf, min_width, max_width, max_n_peaks, min_peak_height):
+    def __init__(self, spectrum, channels, min_width, max_width, max_n_peaks, min_peak_height, cache_key=None):
         super().__init__()
-        self.data = data
-        self.sf = sf
-        self.min_width = min_width
-        self.max_width = max_width
-        self.max_n_peaks = max_n_peaks
-        self.min_peak_height = min_peak_height
+        self.spectrum = spectrum  # () -> (freqs, channels x freqs) Welch PSDs, e.g. from the SpectralEngine
+        # Snapshot of the request: the result is cached under this key, whatever the inputs show by then
+        self.cache_key = cache_key
+        self.channels = tuple(channels)
+        self.setting = (min_width, max_width, max_n_peaks, min_peak_height)
+        self.settings = {'peak_width_limits': (min_width, max_width), 'max_n_peaks': max_n_peaks,
+                         'min_peak_height': min_peak_height}
+        self.store = None  # per-channel fit parameters of every channel
         self.sm = None  # Add this attribute to store the SpectralModel
 
     def run(self):
         print("SpecparamWorker started")
 
-        # Use ThreadPoolExecutor to parallelize the computation
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = list(executor.map(self.process_channel, self.data))
+        freqs, psds = prepare_spectrum(*self.spectrum())
 
-        all_freqs, all_modeled_spectrum, all_aperiodic_fit, all_periodic_fit = zip(*results)
+        # The fit is Python code that holds the GIL, so channels are spread over processes, not threads
+        results = self.fit(freqs, psds)
+        if results is None:
+            print("SpecparamWorker cancelled")
+            return
+        self.store = SpecparamStore(self.channels, freqs, self.settings, results, psds[0].copy())
 
-        # Assuming that all channels have the same frequency range
-        avg_freqs = np.mean(all_freqs, axis=0)
-        avg_modeled_spectrum = np.mean(all_modeled_spectrum, axis=0)
-        avg_aperiodic_fit = np.mean(all_aperiodic_fit, axis=0)
-        avg_periodic_fit = np.mean(all_periodic_fit, axis=0)
+        _, avg_modeled_spectrum, avg_aperiodic_fit, avg_periodic_fit = self.store.curves()
+        self.sm = self.store.first_model()  # Store the first channel's model
 
         print("SpecparamWorker finished processing")
-        self.specparamFinished.emit(avg_freqs, avg_modeled_spectrum, avg_aperiodic_fit, avg_periodic_fit)
-
-    def process_channel(self, channel_data):
-        freqs, psd = signal.welch(channel_data, self.sf, nperseg=4 * self.sf)
-
-        if freqs[0] == 0:
-            freqs = freqs[1:]
-            psd = psd[1:]
+        self.specparamFinished.emit(freqs, avg_modeled_spectrum, avg_aperiodic_fit, avg_periodic_fit)
 
-        freqs = np.asarray(freqs)
-        psd = np.asarray(psd)
+    def fit(self, freqs, psds):
+        """Fit every channel, in batches on the process pool when there is more than one core.
 
-        model = SpectralModel(peak_width_limits=[self.min_width, self.max_width],
-                              max_n_peaks=self.max_n_peaks,
-                              min_peak_height=self.min_peak_height)
-        model.fit(freqs, psd)
-        modeled_spectrum = model.modeled_spectrum_
-        aperiodic_fit = model._ap_fit
-        periodic_fit = modeled_spectrum - aperiodic_fit  # Extract periodic component
+        Returns None as soon as an interruption is requested; batches that have not started are dropped.
+        """
+        n_channels = len(psds)
+        in_thread = pool_size() == 1 or n_channels == 1
+        # A few batches per core balance the load while keeping the per-task overhead small; single
+        # channels in the thread, so that an interruption is noticed between channels
+        batch_size = 1 if in_thread else max(n_channels // (4 * pool_size()), 1)
+        tasks = [(fit_channels, (freqs, psds[start:start + batch_size], self.settings))
+                 for start in range(0, n_channels, batch_size)]
+        parts, done = [None] * len(tasks), 0
 
-        if self.sm is None:
-            self.sm = model  # Store the SpectralModel instance
+        def on_result(idx, part):
+            nonlocal done
+            parts[idx] = part
+            done += len(part['error'])
+            self.progressChanged.emit(done, n_channels)
 
-        return freqs, modeled_spectrum, aperiodic_fit, periodic_fit
+        if not run_tasks(tasks, self.isInterruptionRequested, on_result, in_thread):
+            return None
+        return concatenate_results(parts)
@@ -0,0 +1,238 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import signal
+from scipy.integrate import cumulative_trapezoid
+
+from multitaper import default_n_jobs, multitaper_psd
+from resampler import Resampler, decimation_factor
+
+
+def band_ranges(freqs, bands):
+    """Index range [first, last) of freqs inside each [low, high) band, for ascending freqs."""
+    edges = np.array(list(bands.values()), dtype=float).reshape(-1, 2)
+    return np.searchsorted(freqs, edges[:, 0], side='left'), np.searchsorted(freqs, edges[:, 1], side='left')
+
+
+def band_powers(freqs, psd, bands):
+    """Absolute and relative power of every channel in every band, each (channels x bands).
+
+    Equivalent to np.trapz over each band's frequencies, taken for all channels and bands at once as
+    differences of the cumulative integral. Relative power is over the whole of freqs.
+    """
+    psd = np.atleast_2d(psd)
+    first, last = band_ranges(freqs, bands)
+    cumulative = cumulative_trapezoid(psd, freqs, axis=-1, initial=0)
+    # A band with fewer than two frequencies integrates to zero, as np.trapz would give
+    upper = cumulative[:, np.maximum(last - 1, 0)]
+    lower = cumulative[:, np.minimum(first, len(freqs) - 1)]
+    absolute = np.where(last > first, upper - lower, 0.)
+    return absolute, absolute / cumulative[:, -1:]
+
+
+class SpectralEngine:
+    """Per-channel power spectra shared by every view, cached per (data version, method, parameters).
+
+    Spectra are computed for the channels that are not cached yet and kept in an LRU bounded by
+    max_bytes, so switching tabs or changing the selection only computes what is new. Full-rate Welch
+    PSDs are accumulated over time chunks of about read_bytes, so a lazily opened recording is never read
+    whole. Spectrograms are much larger than PSDs and have an LRU of their own, bounded by
+    spectrogram_max_bytes. Safe to call from worker threads; the computation itself runs outside the lock.
+    """
+
+    def __init__(self, resampler=None, max_bytes=64 * 2 ** 20, read_bytes=64 * 2 ** 20,
+                 spectrogram_max_bytes=256 * 2 ** 20):
+        self.resampler = resampler if resampler is not None else Resampler()  # shared downsampling stage
+        self.max_bytes = max_bytes
+        self.read_bytes = read_bytes
+        self.spectrogram_max_bytes = spectrogram_max_bytes
+        self.spectra = OrderedDict()  # (version, method, params, channel) -> (freqs, psd)
+        self.n_bytes = 0
+        self.spectrograms = OrderedDict()  # (version, 'spectrogram', params, channels) -> whole spectrogram
+        self.spectrogram_bytes = 0
+        self.hits = 0  # lookups served from the cache, per channel spectrum or whole spectrogram
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def welch(self, version, channels, reader, sf, nperseg=None, max_freq=None):
+        """Welch PSDs of the channels, (freqs, channels x freqs).
+
+        With max_freq the data is first downsampled to the lowest rate that resolves it. nperseg defaults
+        to 4 s of data at the rate that is analysed.
+        """
+        factor = decimation_factor(sf, max_freq)
+        nperseg = int(4 * sf / factor) if nperseg is None else int(nperseg)
+        return self.psd('welch', (float(sf), factor, nperseg), version, channels, reader)
+
+    def multitaper(self, version, channels, reader, sf, fmax=np.inf, bandwidth=None, adaptive=True, **kwargs):
+        """Low-bias multitaper PSDs of the channels up to fmax, (freqs, channels x freqs).
+
+        The data is downsampled to the lowest rate that resolves fmax. bandwidth is the full bandwidth in Hz
+        (None for mne's default of 8 frequency bins); adaptive weighting of the tapers is the costly part
+        and can be turned off.
+        """
+        bandwidth = None if bandwidth is None else float(bandwidth)
+        params = (float(sf), decimation_factor(sf, fmax), float(fmax), bandwidth, bool(adaptive))
+        return self.psd('multitaper', params, version, channels, reader, **kwargs)
+
+    def psd(self, method, params, version, channels, reader, block_size=None, progress_callback=None,
+            is_cancelled=None):
+        """Cached spectra of channels; reader(channels, start=0, stop=None) returns their (channels x samples) data.
+
+        Missing channels are computed block_size at a time (all at once by default). Finished blocks are
+        cached even when is_cancelled() stops the rest, in which case None is returned.
+        """
+        channels = list(channels)
+        with self.lock:
+            cached = {channel: self.spectra.get((version, method, params, channel)) for channel in channels}
+        missing = [channel for channel in channels if cached[channel] is None]
+        with self.lock:
+            self.hits += len(channels) - len(missing)
+            self.misses += len(missing)
+
+        block_size = block_size or max(len(missing), 1)
+        for first in range(0, len(missing), block_size):
+            if is_cancelled is not None and is_cancelled():
+                return None
+            block = missing[first:first + block_size]
+            if method == 'welch' and params[1] == 1:
+                freqs, psd = self._chunked_welch(block, reader, params[0], params[2])
+            else:
+                data, sf = self.resampler.decimate_by(version, block, reader, *params[:2])
+                freqs, psd = self._compute(method, params[2:], data, sf)
+            with self.lock:
+                for channel, values in zip(block, psd):
+                    cached[channel] = freqs, values.copy()
+                    self._store((version, method, params, channel), cached[channel])
+            if progress_callback is not None:
+                progress_callback(len(channels) - len(missing) + first + len(block), len(channels))
+
+        with self.lock:
+            for channel in channels:
+                key = (version, method, params, channel)
+                if key in self.spectra:
+                    self.spectra.move_to_end(key)
+        if not channels:
+            return np.empty(0), np.empty((0, 0))
+        freqs = cached[channels[0]][0]
+        return freqs, np.array([cached[channel][1] for channel in channels])
+
+    def spectrogram(self, version, channels, reader, sf, n_times, bands, window=2., step=1., fmax=60.,
+                    chunk_frames=64, progress_callback=None, is_cancelled=None):
+        """Short-time spectra of the channels, computed one chunk of frames at a time.
+
+        Frames are Hann-windowed, mean-removed segments of window seconds every step seconds, scaled like
+        Welch's density. Returns (times, freqs, power, band_power): power is the channel-average
+        (freqs x frames) up to fmax, band_power the (channels x bands x frames) absolute power of each band in
+        bands. Only chunk_frames frames of data are held at a time. Returns None if cancelled.
+        """
+        channels = list(channels)
+        key = (version, 'spectrogram', (float(sf), float(window), float(step), float(fmax),
+                                        tuple((band, tuple(limits)) for band, limits in bands.items())), tuple(channels))
+        with self.lock:
+            if key in self.spectrograms:
+                self.hits += 1
+                self.spectrograms.move_to_end(key)
+                return self.spectrograms[key]
+            self.misses += 1
+
+        n_window, n_step = max(int(window * sf), 2), max(int(step * sf), 1)
+        n_frames = max((n_times - n_window) // n_step + 1, 0)
+        freqs = np.fft.rfftfreq(n_window, 1. / sf)
+        shown = freqs <= fmax
+        taper = signal.get_window('hann', n_window)
+        scale = np.full(len(freqs), 1. / (sf * (taper ** 2).sum()))
+        scale[1:len(freqs) - (n_window % 2 == 0)] *= 2  # one-sided: every bin but DC (and Nyquist) counts twice
+
+        power = np.empty((shown.sum(), n_frames))
+        band_power = np.empty((len(channels), len(bands), n_frames))
+        for first in range(0, n_frames, chunk_frames):
+            if is_cancelled is not None and is_cancelled():
+                return None
+            last = min(first + chunk_frames, n_frames)
+            block = reader(channels, first * n_step, (last - 1) * n_step + n_window)
+            segments = np.lib.stride_tricks.sliding_window_view(block, n_window, axis=-1)[:, ::n_step]
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+            spectra = np.abs(np.fft.rfft(segments * taper, axis=-1)) ** 2 * scale  # channels x frames x freqs
+
+            power[:, first:last] = spectra[:, :, shown].mean(axis=0).T
+            absolute, _ = band_powers(freqs, spectra.reshape(-1, len(freqs)), bands)
+            band_power[:, :, first:last] = absolute.reshape(len(channels), last - first, -1).transpose(0, 2, 1)
+            if progress_callback is not None:
+                progress_callback(last, n_frames)
+
+        times = (np.arange(n_frames) * n_step + n_window / 2) / sf  # frame centres
+        result = times, freqs[shown], power, band_power
+        with self.lock:
+            self.spectrogram_bytes = self._store_in(self.spectrograms, self.spectrogram_bytes,
+                                                    self.spectrogram_max_bytes, key, result)
+        return result
+
+    def _store(self, key, entry):
+        self.n_bytes = self._store_in(self.spectra, self.n_bytes, self.max_bytes, key, entry)
+
+    def _store_in(self, cache, n_bytes, max_bytes, key, entry):
+        """Add entry to an LRU holding n_bytes and evict down to max_bytes; returns the new byte count.
+
+        An entry larger than the whole budget is not cached, rather than evicting everything else.
+        """
+        size = self._nbytes(entry)
+        if key in cache or size > max_bytes:
+            return n_bytes
+        cache[key] = entry
+        n_bytes += size
+        while n_bytes > max_bytes:
+            _, evicted = cache.popitem(last=False)
+            n_bytes -= self._nbytes(evicted)
+        return n_bytes
+
+    @staticmethod
+    def _nbytes(entry):
+        return sum(part.nbytes for part in entry if isinstance(part, np.ndarray))
+
+    def _chunked_welch(self, channels, reader, sf, nperseg):
+        """Welch PSDs of the full-rate channels, read a time chunk of whole segments at a time.
+
+        The same as scipy's Welch over the whole signal: the mean of the segment periodograms, summed per chunk.
+        """
+        step = nperseg - nperseg // 2  # scipy's default half overlap
+        n_segments = max(self.read_bytes // (8 * len(channels) * step), 1)
+        chunk_samples = (n_segments - 1) * step + nperseg
+        start, total, count = 0, None, 0
+        while True:
+            chunk = reader(channels, start, start + chunk_samples)
+            if start == 0 and chunk.shape[-1] < nperseg:
+                return signal.welch(chunk, sf, nperseg=chunk.shape[-1], axis=-1)  # shorter than one segment
+            n_chunk = (chunk.shape[-1] - nperseg) // step + 1 if chunk.shape[-1] >= nperseg else 0
+            if n_chunk:
+                freqs, psd = signal.welch(chunk[:, :(n_chunk - 1) * step + nperseg], sf, nperseg=nperseg, axis=-1)
+                total = psd * n_chunk if total is None else total + psd * n_chunk
+                count += n_chunk
+            if chunk.shape[-1] < chunk_samples:
+                return freqs, total / count
+            start += n_chunk * step
+
+    @staticmethod
+    def _compute(method, params, data, sf):
+        if method == 'welch':
+            nperseg, = params
+            return signal.welch(data, sf, nperseg=min(nperseg, data.shape[-1]), axis=-1)
+        fmax, bandwidth, adaptive = params
+        psd, freqs = multitaper_psd(data, sf, fmax=fmax, bandwidth=bandwidth, adaptive=adaptive,
+                                    n_jobs=default_n_jobs(data))
+        return freqs, psd
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.,
+                    'entries': len(self.spectra), 'bytes': self.n_bytes, 'max_bytes': self.max_bytes,
+                    'spectrograms': len(self.spectrograms), 'spectrogram_bytes': self.spectrogram_bytes}
+
+    def clear(self):
+        with self.lock:
+            self.spectra.clear()
+            self.n_bytes = 0
+            self.spectrograms.clear()
+            self.spectrogram_bytes = 0
@@ -0,0 +1,127 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt6 import QtWidgets, QtGui, QtCore
+
+from spectrogram_worker import SpectrogramWorker
+from worker_slot import WorkerSlot
+
+
+class SpectrogramPlot(QtWidgets.QWidget):
+    """Time-resolved spectrum of the selected channels, with the power of every band over time."""
+
+    def __init__(self, band_d):
+        super().__init__()
+        self.band_d = band_d
+        self.max_freq = 60  # Set maximum frequency to display
+        self.base_colors = [(255, 0, 0), (0, 160, 0), (0, 0, 255), (200, 160, 0), (0, 160, 160), (160, 0, 160),
+                            (0, 0, 0)]
+        self.spectrogram_job = WorkerSlot(on_finished=lambda: self.progressBar.setVisible(False))
+        self.request = None  # arguments of the last plot(), re-used when the window settings change
+        self.times = None
+        self.freqs = None
+        self.power = None  # freqs x frames, averaged over channels
+        self.band_power = None  # channels x bands x frames
+        self.initUI()
+
+    def initUI(self):
+        layout = QtWidgets.QVBoxLayout()
+
+        self.plotWidget = pg.GraphicsLayoutWidget()
+        self.plotWidget.setBackground('w')
+
+        self.spectrogram_plot = self.plotWidget.addPlot(title="Spectrogram (log10 power)")
+        self.spectrogram_plot.setLabel('left', 'Frequency (Hz)', color='k')
+        self.image = pg.ImageItem(axisOrder='row-major')  # the whole spectrogram is a single image
+        self.image.setLookupTable(pg.colormap.get('viridis').getLookupTable())
+        self.spectrogram_plot.addItem(self.image)
+
+        self.plotWidget.nextRow()
+        self.band_plot = self.plotWidget.addPlot(title="Band Power Over Time")
+        self.band_plot.setLabel('bottom', 'Time (s)', color='k')
+        self.band_plot.setLogMode(y=True)
+        self.band_plot.addLegend()
+        self.band_plot.setXLink(self.spectrogram_plot)
+
+        for plot in (self.spectrogram_plot, self.band_plot):
+            plot.getViewBox().setBackgroundColor('w')
+            plot.getAxis('left').setPen('k')
+            plot.getAxis('bottom').setPen('k')
+            plot.getAxis('left').setTextPen('k')
+            plot.getAxis('bottom').setTextPen('k')
+            plot.showGrid(x=True, y=True, alpha=0.5)
+        layout.addWidget(self.plotWidget)
+
+        options_layout = QtWidgets.QFormLayout()
+        self.window_input = QtWidgets.QLineEdit()
+        self.window_input.setValidator(QtGui.QDoubleValidator(0.1, 60.0, 2))
+        self.window_input.setText("2")
+        options_layout.addRow('Window (s):', self.window_input)
+
+        self.step_input = QtWidgets.QLineEdit()
+        self.step_input.setValidator(QtGui.QDoubleValidator(0.01, 60.0, 2))
+        self.step_input.setText("1")
+        options_layout.addRow('Step (s):', self.step_input)
+        layout.addLayout(options_layout)
+
+        self.updateButton = QtWidgets.QPushButton('Update Spectrogram')
+        self.updateButton.clicked.connect(self.recompute)
+        layout.addWidget(self.updateButton)
+
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setVisible(False)
+        layout.addWidget(self.progressBar)
+
+        self.setLayout(layout)
+
+    def plot(self, spectral_engine, version, channels, reader, sf, n_times):
+        """Compute (or fetch from the engine's cache) and show the spectrogram of channels on a worker thread."""
+        self.request = (spectral_engine, version, list(channels), reader, sf, n_times)
+        self.recompute()
+
+    def recompute(self):
+        if self.request is None:
+            return
+        try:
+            window, step = float(self.window_input.text()), float(self.step_input.text())
+        except ValueError:
+            QtWidgets.QMessageBox.warning(self, "Warning", "Invalid window or step.")
+            return
+
+        spectral_engine, version, channels, reader, sf, n_times = self.request
+        worker = SpectrogramWorker(spectral_engine, version, channels, reader, sf, n_times, self.band_d, window,
+                                   step, self.max_freq)
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.spectrogram_job.start(worker, [(worker.progressChanged, self.update_progress),
+                                            (worker.spectrogramFinished, self.update_plot)])
+
+    def cancel(self):
+        """Stop a computation that is no longer wanted; its result, if any, is ignored."""
+        if self.spectrogram_job.cancel():
+            self.progressBar.setVisible(False)
+
+    def update_progress(self, done, total):
+        self.progressBar.setMaximum(max(total, 1))
+        self.progressBar.setValue(done)
+
+    def update_plot(self, result):
+        self.times, self.freqs, self.power, self.band_power = result
+        self.band_plot.clear()
+        if not len(self.times) or not len(self.freqs):
+            self.image.clear()
+            return
+
+        # One pixel per frame and frequency bin, placed on the time and frequency axes
+        step = self.times[1] - self.times[0] if len(self.times) > 1 else 1.
+        df = self.freqs[1] - self.freqs[0] if len(self.freqs) > 1 else 1.
+        self.image.setImage(np.log10(np.maximum(self.power, np.finfo(float).tiny)), autoLevels=True)
+        self.image.setRect(QtCore.QRectF(self.times[0] - step / 2, self.freqs[0] - df / 2,
+                                         step * len(self.times), df * len(self.freqs)))
+
+        mean_band_power = self.band_power.mean(axis=0)
+        for idx, band in enumerate(self.band_d):
+            if np.any(mean_band_power[idx] > 0):
+                color = self.base_colors[idx % len(self.base_colors)]
+                self.band_plot.plot(self.times, mean_band_power[idx], pen=pg.mkPen(color, width=1.5), name=band)
+        self.spectrogram_plot.setXRange(self.times[0] - step / 2, self.times[-1] + step / 2, padding=0)
+        self.spectrogram_plot.setYRange(0, self.freqs[-1], padding=0)
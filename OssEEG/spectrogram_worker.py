@@ -0,0 +1,27 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class SpectrogramWorker(QThread):
+    progressChanged = pyqtSignal(int, int)  # frames done, total frames
+    spectrogramFinished = pyqtSignal(object)  # (times, freqs, power, band_power), see SpectralEngine.spectrogram
+
+    def __init__(self, spectral_engine, version, channels, reader, sf, n_times, bands, window, step, fmax):
+        super().__init__()
+        self.spectral_engine = spectral_engine
+        self.version = version
+        self.channels = channels
+        self.reader = reader
+        self.sf = sf
+        self.n_times = n_times
+        self.bands = bands
+        self.window = window
+        self.step = step
+        self.fmax = fmax
+
+    def run(self):
+        result = self.spectral_engine.spectrogram(self.version, self.channels, self.reader, self.sf, self.n_times,
+                                                  self.bands, window=self.window, step=self.step, fmax=self.fmax,
+                                                  progress_callback=self.progressChanged.emit,
+                                                  is_cancelled=self.isInterruptionRequested)
+        if result is not None:
+            self.spectrogramFinished.emit(result)
@@ -0,0 +1,72 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt6 import QtCore
+
+
+class StackedChannelsItem(pg.GraphicsObject):
+    """Draws many stacked channels as a single graphics item.
+
+    All rows share one time axis and one (rows x points) buffer. Each row is turned into a path of its own
+    samples and shifted to its offset by the painter, so re-stacking never copies the signal, and only rows
+    that intersect the visible y-range are painted.
+    """
+
+    def __init__(self, pen='k'):
+        super().__init__()
+        self.pen = pg.mkPen(pen)
+        self.time = np.empty(0)
+        self.values = np.empty((0, 0))
+        self.offsets = np.empty(0)
+        self.keys = np.empty(0, dtype=int)
+        self.row_height = 1.
+        self.paths = {}  # key -> path of that row's samples
+        self._bounds = QtCore.QRectF()
+
+    def setData(self, time, values, offsets, row_height, keys=None, keep_paths=False):
+        """Show values[i] at offsets[i]; keys identify the rows (e.g. channel indices) across calls.
+
+        With keep_paths the caller guarantees that the time axis and the samples of every key seen before
+        are unchanged, so rows that were already drawn keep their paths and only new keys are built.
+        """
+        self.prepareGeometryChange()
+        keys = np.arange(len(offsets)) if keys is None else np.asarray(keys)
+        if keep_paths:
+            retained = set(keys.tolist())
+            self.paths = {key: path for key, path in self.paths.items() if key in retained}
+        else:
+            self.paths = {}  # built lazily for the rows that actually get painted
+        self.time = time
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.keys = keys
+        self.row_height = row_height
+        if len(time) and len(self.offsets):
+            self._bounds = QtCore.QRectF(time[0], self.offsets.min() - row_height, time[-1] - time[0],
+                                         self.offsets.max() - self.offsets.min() + 2 * row_height)
+        else:
+            self._bounds = QtCore.QRectF()
+        self.update()
+
+    def visibleRows(self, y_min, y_max):
+        """Indices of the rows whose band [offset - row_height, offset + row_height] meets [y_min, y_max]."""
+        return np.flatnonzero((self.offsets + self.row_height >= y_min) & (self.offsets - self.row_height <= y_max))
+
+    def boundingRect(self):
+        return self._bounds
+
+    def paint(self, painter, option, widget=None):
+        if not len(self.time):
+            return
+        view_rect = self.viewRect()
+        rows = self.visibleRows(view_rect.top(), view_rect.bottom()) if view_rect is not None else range(len(self.offsets))
+        painter.setPen(self.pen)
+        for row in rows:
+            key = int(self.keys[row])
+            path = self.paths.get(key)
+            if path is None:
+                path = pg.arrayToQPath(self.time, self.values[row])
+                self.paths[key] = path
+            painter.save()
+            painter.translate(0, self.offsets[row])  # per-channel offset applied at render time
+            painter.drawPath(path)
+            painter.restore()
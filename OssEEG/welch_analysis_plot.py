@@ -1,9 +1,10 @@
 import numpy as np
 import pyqtgraph as pg
 from PyQt6 import QtWidgets, QtCore
-from scipy import signal
 import pandas as pd
 
+from spectral_engine import band_powers
+
 
 class WelchAnalysisPlot(QtWidgets.QWidget):
     def __init__(self, band_d):
@@ -12,6 +13,10 @@ class WelchAnalysisPlot(QtWidgets.QWidget):
         self.plotWidget = None
         self.tableWidget = None
         self.band_d = band_d
+        self.freqs = None
+        self.psd = None  # channels x freqs, as plotted
+        self.band_power = None  # channels x bands, absolute
+        self.relative_band_power = None  # channels x bands, relative to each channel's total
         self.base_colors = [(255, 0, 0, 100), (0, 255, 0, 100), (0, 0, 255, 100), (255, 255, 0, 100),
                             (0, 255, 255, 100)]
         self.initUI()
@@ -56,25 +61,22 @@ class WelchAnalysisPlot(QtWidgets.QWidget):
         self.plotWidget.addItem(self.cursor_text)
         self.plotWidget.scene().sigMouseClicked.connect(self.mouseClicked)
 
-    def plot(self, data, sf):
+    def plot(self, freqs, psd):
+        """Plot Welch PSDs (one per channel, or a single spectrum) as computed by the SpectralEngine."""
         self.plotWidget.clear()
         self.histogramWidget.clear()
 
         max_freq = 60  # Set maximum frequency to display
 
-        if data.ndim == 2:  # Handle multi-channel data
-            psd_all = []
-            for channel in data:
-                freqs, psd = signal.welch(channel, sf, nperseg=4 * sf)  # 4s window
-                psd_all.append(psd)
-            psd = np.mean(psd_all, axis=0)
-        else:  # Handle single-channel data
-            freqs, psd = signal.welch(data, sf, nperseg=4 * sf)  # 4s window
+        freqs, psd = np.asarray(freqs), np.atleast_2d(psd)  # per-channel spectra
 
         # Limit the frequency range
         mask = freqs <= max_freq
         freqs = freqs[mask]
-        psd = psd[mask]
+        self.freqs = freqs
+        self.psd = psd[:, mask]
+        self.band_power, self.relative_band_power = band_powers(freqs, self.psd, self.band_d)
+        psd = self.psd.mean(axis=0)
 
         self.plotWidget.plot(freqs, psd, pen='r')
 
@@ -93,13 +95,8 @@ class WelchAnalysisPlot(QtWidgets.QWidget):
         return colors[:num_bands]
 
     def calculate_relative_power(self, freqs, psd, colors):
-        total_power = np.trapz(psd, freqs)
-        relative_powers = {}
-
-        for band, (low, high) in self.band_d.items():
-            mask = (freqs >= low) & (freqs < high)
-            band_power = np.trapz(psd[mask], freqs[mask])
-            relative_powers[band] = band_power / total_power
+        _, relative = band_powers(freqs, psd, self.band_d)  # of the averaged spectrum
+        relative_powers = dict(zip(self.band_d, relative[0]))
 
         self.update_table(relative_powers)
         self.plot_histogram(relative_powers, colors)
@@ -0,0 +1,42 @@
+class WorkerSlot:
+    """The running QThread worker of one kind of job, e.g. a view's PSD estimate.
+
+    Starting a job cancels the one still running: the old worker is asked to stop, its result signals are
+    disconnected so a late result is never shown, and it is kept alive until its thread has stopped.
+    on_finished is called when the thread of the current worker ends, e.g. to hide a progress bar.
+    """
+
+    def __init__(self, on_finished=None):
+        self.worker = None
+        self.connections = []  # (signal, slot) of the current worker, disconnected when it is cancelled
+        self.cancelled = []  # kept alive until their thread has stopped
+        self.on_finished = on_finished
+
+    def start(self, worker, connections):
+        """Cancel the running job, connect the (signal, slot) pairs of worker and start it."""
+        self.cancel()
+        for signal, slot in connections:
+            signal.connect(slot)
+        worker.finished.connect(lambda: self.worker_finished(worker))
+        self.worker, self.connections = worker, list(connections)
+        worker.start()
+
+    def cancel(self):
+        """Stop the running job, if any; returns whether there was one."""
+        if self.worker is None:
+            return False
+        for signal, slot in self.connections:
+            signal.disconnect(slot)
+        self.worker.requestInterruption()
+        self.cancelled.append(self.worker)
+        self.worker, self.connections = None, []
+        return True
+
+    def worker_finished(self, worker):
+        worker.deleteLater()
+        if worker is self.worker:
+            self.worker, self.connections = None, []
+            if self.on_finished is not None:
+                self.on_finished()
+        elif worker in self.cancelled:
+            self.cancelled.remove(worker)